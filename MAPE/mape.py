@@ -1,11 +1,25 @@
 from __future__ import annotations
+import asyncio
+import settings
 from datetime import datetime
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from app.bootstrap import ApplicationBootstrap
-from app.database.schema import BreakCondition, ClientSchema, GoalsSchema, ProductSchema, PurchaseSchema, SymptomSchema, UpdateCriteria
+from app.database.cache import knowledge_cache
+from app.database.events import event_bus, event_origin
+from app.database.executor import DatabaseExecutor
+from app.database.history import GRANULARITIES
+from app.database.lease import Lease, LeaseLost, current_lease
+from app.database.repository import Repository
+from app.database.schema import BreakCondition, PurchaseSchema, SymptomSchema, UpdateCriteria
+from app.database.unit_of_work import UnitOfWork
+from app.service.generator import seed_baseline
 from app.handler.handler import Effectors
+from app.service.segments import Segment, configured_segments
+from app.service.service import Service
+from app.service.simulation import PlanSimulator
+from app.metrics import MAPE_TICK_SECONDS, phase
 from loguru import logger
-from time import sleep
+from time import perf_counter
 from fastapi_utils.cbv import cbv
 
 
@@ -16,35 +30,345 @@ mape_router = APIRouter()
 class ControlLoop:
     # MAPE-K loop
     def __init__(self):
-        self.planner = Planner()
-        self.analyzer = Analyzer()
-        self.monitor = Monitor()
-        self.executor = Executor()
-    
-    @mape_router.get("/start")
-    async def run(self):
-        logger.info("Control Loop has been started.")
-        number_of_loops = 0
-        await self.monitor.start_event_loop()
-        while True:
-            sleep(2)
+        self.setup()
+
+    def setup(self, segment: Segment = None) -> None:
+        self.segment = segment
+        self.planner = Planner(segment)
+        self.analyzer = Analyzer(segment)
+        self.monitor = Monitor(segment)
+        self.executor = Executor(segment)
+        self.last_unit_of_work: dict = {}
+
+    @classmethod
+    def for_segment(cls, segment: Segment = None) -> ControlLoop:
+        control_loop = cls()
+        if segment is not None:
+            control_loop.setup(segment)
+        return control_loop
+
+    async def tick(self) -> dict:
+        # uma iteração do loop; devolve a duração de cada fase em ms.
+        # As escritas de symptom/goals/monitor/purchase_monitor do tick vão juntas no flush do final
+        phases = {}
+        async with UnitOfWork() as unit_of_work:
+            start = perf_counter()
             event: bool = await self.monitor.store_event()
+            phases["monitor"], start = _elapsed_ms(start), perf_counter()
             symptom: SymptomSchema = await self.analyzer.analyze(event)
+            phases["analyze"], start = _elapsed_ms(start), perf_counter()
             plan = await self.planner.plan(symptom)
+            phases["plan"], start = _elapsed_ms(start), perf_counter()
             await self.executor.execute(plan)
-            must_break = await self.monitor.check_break_condition()
-            number_of_loops += 1
-            logger.info(f"Control Loop has been running for {number_of_loops} loops.")
-            if must_break:
-                logger.info("Control Loop has been stopped.")
-                break
+            phases["execute"], start = _elapsed_ms(start), perf_counter()
+        phases["flush"] = _elapsed_ms(start)
+        self.last_unit_of_work = unit_of_work.stats()
+        return phases
+
+    @mape_router.get("/start")
+    async def run(self):
+        return await leadership.start()
+
+    @mape_router.get("/stop")
+    async def stop(self):
+        return await leadership.stop()
+
+    @mape_router.get("/status")
+    async def status(self):
+        return await leadership.status()
+
+    @mape_router.get("/history")
+    async def history(self, granularity: str = "minute", start: datetime = None, end: datetime = None, segment: str = None, limit: int = 1000):
+        if granularity not in GRANULARITIES:
+            raise HTTPException(status_code=422, detail=f"granularity must be one of {list(GRANULARITIES)}")
+        return await KnowledgeBase(segment=segment).get_purchase_history(granularity, start, end, limit)
+
+    @mape_router.get("/segments/start")
+    async def run_segments(self):
+        # um loop por segmento, todos concorrentes no event loop do worker (ou divididos entre os workers
+        # com MAPE_MAX_LEADERSHIPS)
+        if not segment_leaderships:
+            raise HTTPException(status_code=404, detail="no segments configured, set MAPE_SEGMENTS")
+        return {name: await segment_leadership.start() for name, segment_leadership in segment_leaderships.items()}
+
+    @mape_router.get("/segments/stop")
+    async def stop_segments(self):
+        statuses = await asyncio.gather(*(segment_leadership.stop() for segment_leadership in segment_leaderships.values()))
+        return dict(zip(segment_leaderships, statuses))
+
+    @mape_router.get("/segments/status")
+    async def segments_status(self):
+        return {name: await segment_leadership.status() for name, segment_leadership in segment_leaderships.items()}
+
+
+class LoopScheduler:
+    # roda o ControlLoop (global ou de um segmento) como uma task em background no event loop do worker
+    def __init__(self, interval: float, segment: Segment = None):
+        self.interval = interval
+        self.segment = segment
+        self.label = f"Control Loop [{segment.name}]" if segment else "Control Loop"
+        self.trigger = settings.MAPE["TRIGGER"]
+        # intervalo até o próximo tick sem evento; no modo "event" cresce enquanto o loop está ocioso
+        self.current_interval = interval
+        self.events_received = 0
+        self.last_wake: str | None = None
+        self.task: asyncio.Task | None = None
+        self.stop_event = asyncio.Event()
+        self.number_of_loops = 0
+        self.started_at: datetime | None = None
+        self.last_tick_ms: float | None = None
+        self.last_phases: dict = {}
+        self.last_unit_of_work: dict = {}
+        self.last_simulation: dict = {}
+        self.last_error: str | None = None
+        # lease do LoopLeadership que cerca as escritas dos ticks; None sem eleição de líder
+        self.fence: Lease | None = None
+        # o loop parou porque um flush encontrou o lease com outro dono (não por break condition)
+        self.lease_lost = False
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def start(self) -> dict:
+        if self.running:
+            return self.status()
+        if self.segment is not None:
+            await DatabaseExecutor.run(seed_baseline, ApplicationBootstrap().get_mongo_client(), self.segment.name)
+        control_loop = ControlLoop.for_segment(self.segment)
+        await control_loop.monitor.start_event_loop()
+        self.stop_event = asyncio.Event()
+        self.number_of_loops = 0
+        self.current_interval = self.interval
+        self.started_at = datetime.now()
+        self.last_error = None
+        self.lease_lost = False
+        self.task = asyncio.create_task(self._run(control_loop))
+        return self.status()
+
+    async def stop(self) -> dict:
+        if self.running:
+            self.stop_event.set()
+            await self.task
+        return self.status()
+
+    def status(self) -> dict:
+        return {
+            "segment": self.segment.name if self.segment else None,
+            "running": self.running,
+            "number_of_loops": self.number_of_loops,
+            "interval": self.interval,
+            "trigger": self.trigger,
+            "current_interval": self.current_interval,
+            "events_received": self.events_received,
+            "last_wake": self.last_wake,
+            "started_at": self.started_at,
+            "last_tick_ms": self.last_tick_ms,
+            "last_phases_ms": self.last_phases,
+            "last_unit_of_work": self.last_unit_of_work,
+            "last_simulation": self.last_simulation,
+            "last_error": self.last_error,
+            "knowledge_cache": knowledge_cache.stats(),
+        }
+
+    async def _run(self, control_loop: ControlLoop) -> None:
+        # as escritas feitas pelos ticks desta task não acordam o próprio loop
+        event_origin.set(id(self))
+        current_lease.set(self.fence)
+        segment = self.segment.name if self.segment else None
+        subscription = event_bus.subscribe(segment, origin=id(self)) if self.trigger == "event" else None
+        logger.info(f"{self.label} has been started ({self.trigger} trigger).")
+        try:
+            while not self.stop_event.is_set():
+                start = perf_counter()
+                try:
+                    self.last_phases = await control_loop.tick()
+                    self.last_unit_of_work = control_loop.last_unit_of_work
+                    self.last_simulation = control_loop.planner.simulator.last_report
+                except LeaseLost as error:
+                    # outro processo assumiu o loop: para já, sem esperar o próximo heartbeat do LoopLeadership
+                    logger.warning(f"{self.label} lost its lease: {error}")
+                    self.last_error = repr(error)
+                    self.lease_lost = True
+                    self.stop_event.set()
+                    break
+                except Exception as error:
+                    logger.exception(f"{self.label} tick failed.")
+                    self.last_error = repr(error)
+                self.last_tick_ms = _elapsed_ms(start)
+                MAPE_TICK_SECONDS.observe(self.last_tick_ms / 1000, segment or "")
+                self.number_of_loops += 1
+                logger.info(f"{self.label} has been running for {self.number_of_loops} loops.")
+                events = await self._wait(subscription)
+                if events and any(event.kind == "break_condition" for event in events) and await control_loop.monitor.check_break_condition():
+                    logger.info(f"{self.label} received a break condition.")
+                    break
+        finally:
+            if subscription is not None:
+                subscription.close()
+        logger.info(f"{self.label} has been stopped.")
+
+    async def _wait(self, subscription) -> list | None:
+        # espera o intervalo, o stop ou (no modo "event") um evento; devolve os eventos que acordaram o loop
+        waiters = [asyncio.ensure_future(self.stop_event.wait())]
+        if subscription is not None:
+            waiters.append(asyncio.ensure_future(subscription.wait()))
+        done, pending = await asyncio.wait(waiters, timeout=self.current_interval, return_when=asyncio.FIRST_COMPLETED)
+        for waiter in pending:
+            waiter.cancel()
+        if subscription is None or self.stop_event.is_set():
+            return None
+        if waiters[1] in done:
+            events = waiters[1].result()
+            self.events_received += len(events)
+            self.last_wake = "event"
+            self.current_interval = self.interval
+            return events
+        # polling de reserva: sem eventos, o próximo tick demora mais
+        self.last_wake = "poll"
+        self.current_interval = min(self.current_interval * settings.MAPE["BACKOFF_FACTOR"], settings.MAPE["MAX_IDLE_INTERVAL"])
+        return None
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((perf_counter() - start) * 1000, 3)
+
+
+class LoopLeadership:
+    # com vários workers (gunicorn -w 4) só o dono do lease roda o loop. Todos os processos verificam o lease
+    # a cada HEARTBEAT: o dono renova, os demais assumem quando ele vence (worker morto ou travado).
+    # /start e /stop só ligam/desligam o lease; o loop roda onde estiver o dono
+    _instances: list[LoopLeadership] = []
+
+    def __init__(self, scheduler: LoopScheduler, name: str):
+        self.scheduler = scheduler
+        self.enabled = settings.MAPE["LEADER_ELECTION"]
+        self.name = name
+        self._lease: Lease | None = None
+        self.task: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+        # o loop foi iniciado por este processo como dono do lease
+        self._started = False
+        LoopLeadership._instances.append(self)
+
+    @property
+    def lease(self) -> Lease:
+        # criado no primeiro uso, não no import do módulo
+        if self._lease is None:
+            self._lease = Lease(ApplicationBootstrap().get_mongo_client().leases, self.name)
+        return self._lease
+
+    @classmethod
+    def held(cls) -> int:
+        return sum(1 for leadership in cls._instances if leadership._lease is not None and leadership._lease.is_held())
+
+    async def start(self) -> dict:
+        if not self.enabled:
+            return await self.scheduler.start()
+        self.watch()
+        await DatabaseExecutor.run(self.lease.set_enabled, True)
+        await self.step()
+        return await self.status()
+
+    async def stop(self) -> dict:
+        if not self.enabled:
+            return await self.scheduler.stop()
+        # se o dono for outro processo, ele para no próximo heartbeat
+        await DatabaseExecutor.run(self.lease.set_enabled, False)
+        await self.step()
+        return await self.status()
+
+    async def status(self) -> dict:
+        status = self.scheduler.status()
+        if self.enabled:
+            lease = await DatabaseExecutor.run(self.lease.read)
+            status["leadership"] = {
+                "lease": self.lease.name,
+                "enabled": lease.get("enabled", False),
+                "holder": lease.get("holder"),
+                "is_leader": self.lease.is_held(),
+                "term": lease.get("term"),
+                "expires_at": lease.get("expires_at"),
+                "process": self.lease.holder,
+            }
+        return status
+
+    def watch(self) -> None:
+        if self.enabled and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self._watch())
+
+    async def close(self) -> None:
+        # saída do worker: para o loop local e libera o lease para outro processo assumir sem esperar o ttl
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        await self.scheduler.stop()
+        self._started = False
+        if self.enabled and self.lease.is_held():
+            await DatabaseExecutor.run(self.lease.release)
+
+    async def _watch(self) -> None:
+        while True:
+            try:
+                await self.step()
+            except Exception:
+                logger.exception(f"{self.scheduler.label} leadership check failed.")
+            # sem conseguir renovar, o loop para se o lease vencer antes do próximo heartbeat, antes de outro
+            # processo poder assumir; escritas de um tick já em curso são barradas pelo termo na UnitOfWork
+            heartbeat = settings.MAPE["HEARTBEAT_INTERVAL"]
+            if self.scheduler.running and not self.lease.is_held(margin=heartbeat):
+                logger.warning(f"{self.scheduler.label} could not renew lease {self.lease.name!r} in time, stopping.")
+                await self.scheduler.stop()
+                self._started = False
+            await asyncio.sleep(heartbeat)
+
+    async def step(self) -> None:
+        async with self._lock:
+            if self._started and not self.scheduler.running and self.scheduler.lease_lost:
+                # o loop parou por ter perdido o lease: segue a eleição normal, sem desligar o loop nos outros processos
+                self._started = False
+            elif self._started and not self.scheduler.running:
+                # o loop parou sozinho (break condition): fica parado em todos os processos
+                self._started = False
+                await DatabaseExecutor.run(self.lease.set_enabled, False)
+                await self._resign()
+                return
+            lease = await DatabaseExecutor.run(self.lease.read)
+            if not lease.get("enabled"):
+                await self._resign()
+                return
+            limit = settings.MAPE["MAX_LEADERSHIPS"]
+            if limit and not self.lease.is_held() and LoopLeadership.held() >= limit:
+                # este processo já roda loops suficientes; o lease fica para outro worker
+                return
+            if await DatabaseExecutor.run(self.lease.acquire):
+                if not self.scheduler.running:
+                    logger.info(f"{self.scheduler.label} acquired lease {self.lease.name!r} (term {self.lease.term}).")
+                    # o dono anterior pode ter gravado o estado do loop: o cache deste processo não vale mais
+                    knowledge_cache.invalidate()
+                    self.scheduler.fence = self.lease
+                    await self.scheduler.start()
+                    self._started = True
+            else:
+                await self._resign()
+
+    async def _resign(self) -> None:
+        if self.scheduler.running:
+            logger.info(f"{self.scheduler.label} is not the leader of {self.lease.name!r}, stopping.")
+            await self.scheduler.stop()
+        self._started = False
+        if self.lease.is_held():
+            await DatabaseExecutor.run(self.lease.release)
 
 
 class Planner:
-    def __init__(self):
-        self.executor = Executor()
-        self.repository = KnowledgeBase()
+    def __init__(self, segment: Segment = None):
+        self.segment = segment
+        self.executor = Executor(segment)
+        self.repository = KnowledgeBase.for_segment(segment)
+        self.simulator = PlanSimulator(self.repository, segment.filter if segment else None)
     
+    @phase("planner.plan")
     async def plan(self, symptom: SymptomSchema = None) -> UpdateCriteria:
         goals = await self.repository.get_goals()
         if symptom is None or not symptom.update_symptom:
@@ -55,25 +379,25 @@ class Planner:
                 goals_value = getattr(goals, field)
                 updated_goals_value = round(goals_value * 1.05) if isinstance(goals_value, int) else goals_value * 1.05
                 setattr(goals, field, updated_goals_value)
-                await self.repository.update_goals(goals)
+            await self.repository.update_goals(goals)
             return None
         update_criteria = dict()
         for field in symptom.symptoms:
             goals_value = getattr(goals, field)
             update_criteria[field] = goals_value
-        print('analysing_', end='')
-        sleep(1)
-        print('_'*50, end='')
-        print('_'*100)
         logger.info(f'must update fields: {update_criteria}')
+        if settings.PLANNER["MODE"] == "simulate":
+            return await self.simulator.best_plan(goals, UpdateCriteria(**update_criteria))
         return UpdateCriteria(**update_criteria)
 
 
 class Analyzer:
-    def __init__(self):
-        self.symptom = Symptom()
-        self.repository = KnowledgeBase()
+    def __init__(self, segment: Segment = None):
+        self.segment = segment
+        self.symptom = Symptom(segment)
+        self.repository = KnowledgeBase.for_segment(segment)
 
+    @phase("analyzer.analyze")
     async def analyze(self, event: bool) -> SymptomSchema:
         if not event:
             logger.info('nothing to analyse')
@@ -83,31 +407,34 @@ class Analyzer:
         
 
 class Symptom:
-    def __init__(self):
-        self.repository = KnowledgeBase()
+    def __init__(self, segment: Segment = None):
+        self.repository = KnowledgeBase.for_segment(segment)
 
     async def get_symptom(self) -> SymptomSchema:
         return await self.repository.get_symptom()
 
 
 class Monitor:
-    def __init__(self):
-        self.sensors = Sensors()
+    def __init__(self, segment: Segment = None):
+        self.segment = segment
+        self.sensors = Sensors(segment)
 
     async def start_event_loop(self) -> None:
         await self.sensors.cancel_break_condition()
 
+    @phase("monitor.check_break_condition")
     async def check_break_condition(self) -> bool:
         condition = await self.sensors.check_break_condition()
         return condition.break_condition
 
+    @phase("monitor.store_event")
     async def store_event(self) -> PurchaseSchema:
         return await self.sensors.store_event()
 
 
 class Sensors:
-    def __init__(self):
-        self.repository = KnowledgeBase()
+    def __init__(self, segment: Segment = None):
+        self.repository = KnowledgeBase.for_segment(segment)
 
     async def check_break_condition(self) -> BreakCondition:
         return await self.repository.get_break_condition()
@@ -118,16 +445,13 @@ class Sensors:
     async def store_event(self) -> PurchaseSchema:
         last_purchase = await self.repository.get_last_purchase()
         goals = await self.repository.get_goals()
-        # resetando sintomas
-        symptom_schema = SymptomSchema(update_symptom=False, symptoms=[])
-        await self.repository.update_symptom(symptom_schema)
         has_to_update_symptom, symptom = await self._check_goals(last_purchase, goals)
+        # o sintoma é gravado uma única vez: resetado ou com os problemas detectados
         if has_to_update_symptom:
             logger.info(f'problems are detected: {symptom}')
-            symptom_schema = SymptomSchema(update_symptom=True, symptoms=symptom)
-            await self.repository.update_symptom(symptom_schema)
+            await self.repository.update_symptom(SymptomSchema(update_symptom=True, symptoms=symptom))
             return True
-
+        await self.repository.update_symptom(SymptomSchema(update_symptom=False, symptoms=[]))
         return False
 
     async def _check_goals(self, last_purchase, goals) -> bool:
@@ -148,92 +472,29 @@ class Sensors:
 
 
 class Executor:
-    def __init__(self):
+    def __init__(self, segment: Segment = None):
+        self.segment = segment
         self.effectors = Effectors()
+        if segment is not None:
+            # os rounds do segmento só leem e gravam os seus clientes, e registram a compra no histórico dele
+            self.effectors.service = Service(Repository(segment=segment.name), filter=segment.filter)
 
+    @phase("executor.execute")
     async def execute(self, plan = None):
         if plan:
             await self.effectors.update_favorite_model(plan)
         await self.effectors.purchase_round()
 
 
-class KnowledgeBase:
-    def __init__(self):
-        self.client = ApplicationBootstrap().get_mongo_client().clients
-        self.product = ApplicationBootstrap().get_mongo_client().products
-        self.monitor = ApplicationBootstrap().get_mongo_client().monitor
-        self.purchase_monitor = ApplicationBootstrap().get_mongo_client().purchase_monitor
-        self.symptom = ApplicationBootstrap().get_mongo_client().symptom
-        self.goals = ApplicationBootstrap().get_mongo_client().goals
-
-    def get_client(self, **kwargs) -> ClientSchema:
-        client = self.client.find_one(kwargs)
-        client = ClientSchema(**client)
-        return client
-
-    async def update_client(self, **kwargs) -> bool:
-        filter = {"client_uuid": kwargs["client_uuid"]}
-        new_values = {"$set": kwargs}
-        self.client.update_one(filter, new_values)
-        return True
-
-    async def get_all_clients(self) -> list[ClientSchema]:
-        clients = self.client.find()
-        return [ClientSchema(**client) for client in clients]
-    
-    async def get_all_products(self) -> dict:
-        products = self.product.find()
-        return [ProductSchema(**product) for product in products]
-    
-    async def update_goals(self, goals: GoalsSchema):
-        self.goals.update_one({}, {"$set": goals.model_dump()})
-        return True
-
-    def get_product(self, **kwargs) -> ProductSchema:
-        product = self.product.find_one(kwargs)
-        product = ProductSchema(**product)
-        return product
-
-    async def populate_client(self, data):
-        self.client.insert_many(data)
-        return True
-    
-    async def populate_product(self, data):
-        self.product.insert_many(data)
-        return True
-    
-    async def get_break_condition(self):
-        break_condition = self.monitor.find_one()
-        return BreakCondition(**break_condition)
-    
-    async def cancel_break_condition(self):
-        self.monitor.update_one({}, {"$set": {"break_condition": False, "updated_at": datetime.now()}})
-        return True
-
-    async def get_last_purchase(self):
-        purchase = self.purchase_monitor.find()
-        last_purchase = next(purchase.sort("updated_at", -1).limit(1))
-        return PurchaseSchema(**last_purchase)
+class KnowledgeBase(Repository):
+    # a base de conhecimento do loop é a mesma camada de dados do Service; a classe própria
+    # só separa as métricas (database_operation_seconds{repository="KnowledgeBase"})
+    @classmethod
+    def for_segment(cls, segment: Segment = None) -> KnowledgeBase:
+        return cls(segment=segment.name if segment else None)
 
-    async def insert_symptom(self, symptom: SymptomSchema):
-        self.symptom.insert_one(symptom.model_dump())
-        return True
 
-    async def insert_break_condition(self, break_state: BreakCondition):
-            self.monitor.insert_one(break_state.to_dict())
-            return True
-        
-    async def get_goals(self) -> GoalsSchema:
-        goals = self.goals.find_one()
-        return GoalsSchema(**goals)
-    
-    async def update_symptom(self, symptom: SymptomSchema):
-        self.symptom.update_one({}, {"$set": {"update_symptom": symptom.update_symptom, "symptoms": symptom.symptoms}})
-    
-    async def get_symptom(self) -> SymptomSchema:
-        symptom = self.symptom.find_one()
-        return SymptomSchema(**symptom)
-    
-    async def insert_purchase_monitor(self, purchase: PurchaseSchema):
-        self.purchase_monitor.insert_one(purchase.model_dump())
-        return True
+scheduler = LoopScheduler(interval=settings.MAPE["TICK_INTERVAL"])
+segment_schedulers = {segment.name: LoopScheduler(interval=settings.MAPE["TICK_INTERVAL"], segment=segment) for segment in configured_segments()}
+leadership = LoopLeadership(scheduler, "mape")
+segment_leaderships = {name: LoopLeadership(segment_scheduler, f"mape:{name}") for name, segment_scheduler in segment_schedulers.items()}
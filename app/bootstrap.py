@@ -1,10 +1,106 @@
 import certifi
 import settings
+from threading import Lock
 from pymongo import MongoClient
+from pymongo.monitoring import ConnectionPoolListener
+
+
+class PoolCounter(ConnectionPoolListener):
+    # contadores de pools/conexões vivos, alimentados pelos eventos do pymongo
+    def __init__(self):
+        self._lock = Lock()
+        self.pools = 0
+        self.connections = 0
+        self.checked_out = 0
+        self.connections_created = 0
+
+    def _add(self, field: str, value: int) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + value)
+
+    def pool_created(self, event):
+        self._add("pools", 1)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        self._add("pools", -1)
+
+    def connection_created(self, event):
+        self._add("connections", 1)
+        self._add("connections_created", 1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add("connections", -1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
+
+    def connection_checked_out(self, event):
+        self._add("checked_out", 1)
+
+    def connection_checked_in(self, event):
+        self._add("checked_out", -1)
+
+    def to_dict(self) -> dict:
+        return {
+            "pools": self.pools,
+            "connections": self.connections,
+            "checked_out": self.checked_out,
+            "connections_created": self.connections_created,
+        }
+
 
 class ApplicationBootstrap:
+    # um único MongoClient (e seu pool de conexões) por processo
+    _client: MongoClient | None = None
+    _lock = Lock()
+    clients_created = 0
+    pool_counter = PoolCounter()
 
     def get_mongo_client(self):
-        ca = certifi.where()
-        client = MongoClient(settings.MONGO["MONGO_HOST"], tlsCAFile=ca)
-        return client[settings.MONGO["MONGO_DATABASE"]]
+        return self.get_shared_client()[settings.MONGO["MONGO_DATABASE"]]
+
+    @classmethod
+    def get_shared_client(cls) -> MongoClient:
+        with cls._lock:
+            if cls._client is None:
+                ca = certifi.where()
+                cls._client = MongoClient(
+                    settings.MONGO["MONGO_HOST"],
+                    tlsCAFile=ca,
+                    maxPoolSize=settings.MONGO["MAX_POOL_SIZE"],
+                    minPoolSize=settings.MONGO["MIN_POOL_SIZE"],
+                    maxIdleTimeMS=settings.MONGO["MAX_IDLE_TIME_MS"],
+                    connectTimeoutMS=settings.MONGO["CONNECT_TIMEOUT_MS"],
+                    serverSelectionTimeoutMS=settings.MONGO["SERVER_SELECTION_TIMEOUT_MS"],
+                    socketTimeoutMS=settings.MONGO["SOCKET_TIMEOUT_MS"],
+                    event_listeners=[cls.pool_counter],
+                )
+                cls.clients_created += 1
+            return cls._client
+
+    @classmethod
+    def close(cls) -> None:
+        with cls._lock:
+            if cls._client is not None:
+                cls._client.close()
+                cls._client = None
+
+    @classmethod
+    def pool_stats(cls) -> dict:
+        return {
+            "clients_created": cls.clients_created,
+            "client_open": cls._client is not None,
+            **cls.pool_counter.to_dict(),
+        }
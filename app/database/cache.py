@@ -0,0 +1,120 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from pydantic import BaseModel
+import settings
+
+
+class KnowledgeCache:
+    # estado do loop MAPE (goals, symptom, monitor, última compra) em memória, com escrita write-through.
+    # Os valores são copiados na leitura para que quem altera o schema não altere o cache.
+    def __init__(self, ttl: float = 0):
+        self.ttl = ttl
+        self._entries: dict[str, tuple[BaseModel, float]] = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> BaseModel | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl and monotonic() - entry[1] > self.ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0].model_copy(deep=True)
+
+    def set(self, key: str, value: BaseModel) -> None:
+        with self._lock:
+            self._entries[key] = (value.model_copy(deep=True), monotonic())
+
+    def peek(self, key: str) -> BaseModel | None:
+        # leitura sem contar hit/miss e sem checar TTL, para comparar antes de escrever
+        entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    def invalidate(self, key: str = None) -> None:
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "entries": list(self._entries),
+            "ttl": self.ttl,
+        }
+
+
+class ClientCache:
+    # respostas já serializadas de GET /client/{client_uuid} (corpo em bytes + ETag), em LRU com TTL.
+    # As escritas em clientes invalidam as chaves. Cada invalidação avança generation e deixa uma marca
+    # na chave, para que uma leitura iniciada antes da escrita não devolva ao cache o documento antigo.
+    # O cache é por processo: só as escritas feitas neste worker invalidam as chaves. Escritas de outro
+    # worker (ou de fora da aplicação) aparecem quando a entrada vence, então TTL é o atraso máximo entre workers
+    def __init__(self, size: int, ttl: float = 0):
+        self.size = size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[bytes, str, float]] = OrderedDict()
+        self._lock = Lock()
+        self.generation = 0
+        self._invalidated: dict[str, int] = {}
+        # leituras de gerações abaixo de _floor são descartadas (após limpar as marcas)
+        self._floor = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> tuple[bytes, str] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl and monotonic() - entry[2] > self.ttl):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def set(self, key: str, body: bytes, etag: str, generation: int) -> None:
+        with self._lock:
+            if not self.size or generation < self._floor or self._invalidated.get(key, -1) > generation:
+                return
+            self._entries[key] = (body, etag, monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, keys=None) -> None:
+        # keys=None limpa tudo (ex.: round com escrita em massa)
+        with self._lock:
+            self.generation += 1
+            if keys is None:
+                self._entries.clear()
+                self._invalidated.clear()
+                self._floor = self.generation
+                return
+            for key in keys:
+                self._entries.pop(key, None)
+                self._invalidated[key] = self.generation
+            if len(self._invalidated) > self.size:
+                self._invalidated.clear()
+                self._floor = self.generation
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "entries": len(self._entries),
+            "size": self.size,
+            "ttl": self.ttl,
+        }
+
+
+knowledge_cache = KnowledgeCache(ttl=settings.KNOWLEDGE_CACHE["TTL"])
+client_cache = ClientCache(size=settings.CLIENT_CACHE["SIZE"], ttl=settings.CLIENT_CACHE["TTL"])
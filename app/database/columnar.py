@@ -0,0 +1,316 @@
+# Snapshot colunar de clients / products / purchase_monitor para análise offline e rounds sem Mongo.
+#
+#   python -m app.database.columnar --output exports/snapshot                  (mmap, lido por ColumnarSnapshot)
+#   python -m app.database.columnar --output exports/snapshot --format npz     (compacto, um .npz por row group)
+#   python -m app.database.columnar --output exports/snapshot --format parquet (requer pyarrow)
+#
+# Cada coleção vira um diretório com manifest.json. Os documentos são lidos em row groups de ROW_GROUP_SIZE
+# e gravados um grupo por vez, então a memória não cresce com o tamanho da coleção.
+# Strings ficam como bytes utf-8 + tamanhos; listas (favorites_list) como contagem por linha + colunas dos itens.
+import argparse
+import json
+import os
+from datetime import datetime
+from itertools import islice
+import numpy as np
+import settings
+
+# coluna -> tipo; numéricos que podem faltar são float64 (NaN), datas são datetime64[ms] (NaT), strings ausentes viram ""
+EXPORTS = {
+    "clients": {
+        "columns": {
+            "client_uuid": "str", "name": "str", "email": "str", "gender": "str", "civil_status": "str",
+            "number_of_dependents": "int64", "education_level": "str", "profession": "str", "income": "float64",
+            "number_of_vehicle": "int64", "number_of_properties": "int64", "payment_method": "str",
+            "favorite_product": "str", "hobbies": "str", "favorite_music_genre": "str", "favorite_brand": "str",
+            "favorite_social_media": "str", "gadget_used": "str", "classification": "int64",
+            "last_purchase.total_items": "float64", "last_purchase.total_value": "float64", "last_purchase.updated_at": "datetime",
+        },
+        "lists": {"favorites_list": {"product_uuid": "str", "name": "str", "price": "float64"}},
+    },
+    "products": {
+        "columns": {
+            "product_uuid": "str", "name": "str", "price": "float64", "category": "str",
+            "brand": "str", "provider": "str", "description": "str",
+        },
+        "lists": {},
+    },
+    "purchase_monitor": {
+        "columns": {
+            "segment": "str", "total_items": "float64", "total_value": "float64", "total_clients": "float64",
+            "average_value_per_client": "float64", "average_items_per_client": "float64",
+            "diferent_products": "float64", "updated_at": "datetime",
+        },
+        "lists": {},
+    },
+}
+FORMATS = ("mmap", "npz", "parquet")
+
+
+def _lookup(document: dict, path: str):
+    for key in path.split("."):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(key)
+    return document
+
+
+def _encode(arrays: dict, name: str, kind: str, values: list) -> None:
+    if kind == "str":
+        encoded = [(value if isinstance(value, str) else "" if value is None else str(value)).encode() for value in values]
+        arrays[f"{name}.lengths"] = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        arrays[f"{name}.data"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    elif kind == "datetime":
+        arrays[name] = np.array([value if isinstance(value, datetime) else None for value in values], dtype="datetime64[ms]")
+    elif kind == "float64":
+        arrays[name] = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    else:
+        arrays[name] = np.array([value or 0 for value in values], dtype=kind)
+
+
+def encode_group(documents: list[dict], spec: dict) -> dict[str, np.ndarray]:
+    # um row group em arrays planos; a mesma forma para os três formatos
+    arrays = {}
+    for name, kind in spec["columns"].items():
+        _encode(arrays, name, kind, [_lookup(document, name) for document in documents])
+    for name, fields in spec["lists"].items():
+        rows = [_lookup(document, name) or [] for document in documents]
+        arrays[f"{name}.counts"] = np.fromiter(map(len, rows), dtype=np.int64, count=len(rows))
+        items = [item for row in rows for item in row]
+        for field, kind in fields.items():
+            _encode(arrays, f"{name}.{field}", kind, [item.get(field) for item in items])
+    return arrays
+
+
+class _MmapWriter:
+    # um arquivo binário por array, acrescentado a cada row group; o manifest guarda dtype e tamanho
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.files = {}
+        self.arrays = {}
+
+    def write(self, arrays: dict, documents: list[dict]) -> None:
+        for key, array in arrays.items():
+            if key not in self.files:
+                self.files[key] = open(os.path.join(self.directory, f"{key}.bin"), "wb")
+                self.arrays[key] = {"file": f"{key}.bin", "dtype": array.dtype.str, "length": 0}
+            self.files[key].write(np.ascontiguousarray(array).tobytes())
+            self.arrays[key]["length"] += array.size
+
+    def close(self) -> dict:
+        for file in self.files.values():
+            file.close()
+        return {"arrays": self.arrays}
+
+
+class _NpzWriter:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.parts = []
+
+    def write(self, arrays: dict, documents: list[dict]) -> None:
+        name = f"part-{len(self.parts):05d}.npz"
+        np.savez_compressed(os.path.join(self.directory, name), **arrays)
+        self.parts.append({"file": name, "rows": len(documents)})
+
+    def close(self) -> dict:
+        return {"parts": self.parts}
+
+
+class _ParquetWriter:
+    # um row group do Parquet por row group lido; as listas ficam como coluna de listas de structs
+    def __init__(self, directory: str, spec: dict):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as error:
+            raise RuntimeError("the parquet format requires pyarrow (pip install pyarrow)") from error
+        self.pyarrow = pyarrow
+        self.path = os.path.join(directory, "data.parquet")
+        self.spec = spec
+        self.writer = None
+        self.parquet = pyarrow.parquet
+
+    def write(self, arrays: dict, documents: list[dict]) -> None:
+        import pandas as pd
+        frame = pd.DataFrame({name: [_lookup(document, name) for document in documents] for name in self.spec["columns"]})
+        for name, fields in self.spec["lists"].items():
+            frame[name] = [[{field: item.get(field) for field in fields} for item in _lookup(document, name) or []] for document in documents]
+        table = self.pyarrow.Table.from_pandas(frame, preserve_index=False)
+        if self.writer is None:
+            self.writer = self.parquet.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close(self) -> dict:
+        if self.writer is not None:
+            self.writer.close()
+        return {"file": "data.parquet"}
+
+
+def export_collection(database, collection: str, directory: str, format: str = "mmap", row_group_size: int = None, filter: dict = None) -> dict:
+    # bloqueante (pymongo): use via DatabaseExecutor.run
+    spec = EXPORTS[collection]
+    row_group_size = row_group_size or settings.EXPORT["ROW_GROUP_SIZE"]
+    directory = os.path.join(directory, collection)
+    writer = {"mmap": _MmapWriter, "npz": _NpzWriter}[format](directory) if format != "parquet" else _ParquetWriter(directory, spec)
+    os.makedirs(directory, exist_ok=True)
+    rows = row_groups = 0
+    cursor = database[collection].find(filter or {}, {"_id": 0}, batch_size=row_group_size)
+    try:
+        while documents := list(islice(cursor, row_group_size)):
+            writer.write(encode_group(documents, spec) if format != "parquet" else None, documents)
+            rows += len(documents)
+            row_groups += 1
+    finally:
+        cursor.close()
+    manifest = {
+        "collection": collection,
+        "format": format,
+        "rows": rows,
+        "row_groups": row_groups,
+        "row_group_size": row_group_size,
+        "exported_at": datetime.now().isoformat(),
+        "columns": spec["columns"],
+        "lists": spec["lists"],
+        **writer.close(),
+    }
+    with open(os.path.join(directory, "manifest.json"), "w") as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+def export_snapshot(database, directory: str, collections: list[str] = None, format: str = "mmap", row_group_size: int = None, exist_ok: bool = True) -> dict:
+    # exist_ok=False recusa um diretório já existente em vez de misturar dois snapshots
+    if format not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}")
+    collections = collections or list(EXPORTS)
+    unknown = set(collections) - set(EXPORTS)
+    if unknown:
+        raise ValueError(f"unknown collections {sorted(unknown)}, expected some of {list(EXPORTS)}")
+    os.makedirs(directory, exist_ok=exist_ok)
+    manifests = {collection: export_collection(database, collection, directory, format, row_group_size) for collection in collections}
+    return {"directory": directory, "format": format, "collections": {name: {"rows": manifest["rows"], "row_groups": manifest["row_groups"]} for name, manifest in manifests.items()}}
+
+
+class _GroupReader:
+    # lê um intervalo de linhas de arrays planos (memmap da tabela inteira ou um part .npz);
+    # os offsets de strings e listas são calculados uma vez por array
+    def __init__(self, arrays, spec: dict):
+        self.arrays = arrays
+        self.spec = spec
+        self._offsets = {}
+
+    def _offsets_of(self, key: str) -> np.ndarray:
+        if key not in self._offsets:
+            lengths = self.arrays[key]
+            offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=offsets[1:])
+            self._offsets[key] = offsets
+        return self._offsets[key]
+
+    def _read(self, name: str, kind: str, start: int, stop: int):
+        if kind != "str":
+            return np.asarray(self.arrays[name][start:stop])
+        offsets = self._offsets_of(f"{name}.lengths")
+        data = self.arrays[f"{name}.data"]
+        block = bytes(data[offsets[start]:offsets[stop]])
+        relative = offsets[start:stop + 1] - offsets[start]
+        return [block[begin:end].decode() for begin, end in zip(relative[:-1], relative[1:])]
+
+    def read(self, start: int, stop: int, columns: list[str] = None) -> dict:
+        # colunas pedidas (todas por padrão); para uma lista, "<lista>.counts" e "<lista>.<campo>" dos itens
+        batch = {}
+        for name, kind in self.spec["columns"].items():
+            if columns is None or name in columns:
+                batch[name] = self._read(name, kind, start, stop)
+        for name, fields in self.spec["lists"].items():
+            wanted = [field for field in fields if columns is None or name in columns or f"{name}.{field}" in columns]
+            if not wanted:
+                continue
+            items = self._offsets_of(f"{name}.counts")
+            batch[f"{name}.counts"] = np.asarray(self.arrays[f"{name}.counts"][start:stop])
+            for field in wanted:
+                batch[f"{name}.{field}"] = self._read(f"{name}.{field}", fields[field], items[start], items[stop])
+        return batch
+
+
+class SnapshotTable:
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, "manifest.json")) as file:
+            self.manifest = json.load(file)
+        self.rows = self.manifest["rows"]
+        self.spec = {"columns": self.manifest["columns"], "lists": self.manifest["lists"]}
+        if self.manifest["format"] == "mmap":
+            self._reader = _GroupReader(self._memmaps(), self.spec)
+        elif self.manifest["format"] != "npz":
+            raise ValueError(f"{self.manifest['format']} snapshots are not readable by ColumnarSnapshot (use pandas.read_parquet)")
+
+    def _memmaps(self) -> dict:
+        # só o cabeçalho é lido; as páginas vêm do disco conforme os intervalos são acessados
+        arrays = {}
+        for key, array in self.manifest["arrays"].items():
+            path = os.path.join(self.directory, array["file"])
+            dtype = np.dtype(array["dtype"])
+            arrays[key] = np.memmap(path, dtype=dtype, mode="r", shape=(array["length"],)) if array["length"] else np.empty(0, dtype=dtype)
+        return arrays
+
+    def batches(self, batch_size: int = None, columns: list[str] = None, start: int = 0, stop: int = None):
+        # lotes de até batch_size linhas entre start e stop (num snapshot npz, no máximo um part por vez em memória)
+        batch_size = batch_size or settings.EXPORT["ROW_GROUP_SIZE"]
+        stop = self.rows if stop is None else min(stop, self.rows)
+        if self.manifest["format"] == "mmap":
+            for begin in range(start, stop, batch_size):
+                yield self._reader.read(begin, min(begin + batch_size, stop), columns)
+            return
+        offset = 0
+        for part in self.manifest["parts"]:
+            part_start, part_stop = max(start - offset, 0), min(stop - offset, part["rows"])
+            offset += part["rows"]
+            if part_start >= part_stop:
+                continue
+            with np.load(os.path.join(self.directory, part["file"])) as arrays:
+                reader = _GroupReader({key: arrays[key] for key in arrays.files}, self.spec)
+                for begin in range(part_start, part_stop, batch_size):
+                    yield reader.read(begin, min(begin + batch_size, part_stop), columns)
+
+    def column(self, name: str):
+        # coluna inteira; num snapshot mmap as numéricas voltam como memmap, sem cópia
+        kind = self.spec["columns"][name]
+        if self.manifest["format"] == "mmap" and kind != "str":
+            return self._reader.arrays[name]
+        parts = [batch[name] for batch in self.batches(columns=[name])]
+        if kind == "str":
+            return [value for part in parts for value in part]
+        return np.concatenate(parts) if parts else np.empty(0, dtype="datetime64[ms]" if kind == "datetime" else kind)
+
+
+class ColumnarSnapshot:
+    # leitor de um diretório gerado por export_snapshot (formatos mmap e npz)
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.collections = [name for name in EXPORTS if os.path.exists(os.path.join(directory, name, "manifest.json"))]
+        self._tables = {}
+
+    def table(self, collection: str) -> SnapshotTable:
+        if collection not in self.collections:
+            raise FileNotFoundError(f"{collection} is not in the snapshot at {self.directory}")
+        if collection not in self._tables:
+            self._tables[collection] = SnapshotTable(os.path.join(self.directory, collection))
+        return self._tables[collection]
+
+
+def main():
+    from app.bootstrap import ApplicationBootstrap
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", required=True, help="diretório do snapshot (um subdiretório por coleção)")
+    parser.add_argument("--format", choices=FORMATS, default="mmap")
+    parser.add_argument("--collections", type=lambda value: value.split(","), default=list(EXPORTS))
+    parser.add_argument("--row-group-size", type=int, default=settings.EXPORT["ROW_GROUP_SIZE"])
+    args = parser.parse_args()
+    report = export_snapshot(ApplicationBootstrap().get_mongo_client(), args.output, args.collections, args.format, args.row_group_size)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import asyncio
+import threading
+from collections import deque
+from contextvars import ContextVar
+from loguru import logger
+
+from app.database.cache import knowledge_cache
+
+# quem está gravando no contexto atual (o LoopScheduler marca o seu tick); um loop não acorda com as próprias escritas
+event_origin: ContextVar[int | None] = ContextVar("event_origin", default=None)
+
+# coleção -> tipo de evento e chave do knowledge_cache que fica desatualizada quando outro processo grava
+# (purchase_monitor pode ser time-series, que não tem change stream; o ponteiro purchase_latest muda a cada round)
+WATCHED_COLLECTIONS = {
+    "purchase_latest": ("purchase", "last_purchase"),
+    "monitor": ("break_condition", "monitor"),
+}
+
+
+class LoopEvent:
+    def __init__(self, kind: str, segment: str = None, origin: int = None, document_id=None):
+        self.kind = kind
+        self.segment = segment
+        self.origin = origin
+        self.document_id = document_id
+
+    def __repr__(self) -> str:
+        return f"LoopEvent({self.kind!r}, segment={self.segment!r})"
+
+
+class Subscription:
+    # eventos de um segmento para um LoopScheduler; wait() acorda no primeiro evento pendente
+    def __init__(self, bus: "EventBus", segment: str, origin: int):
+        self.bus = bus
+        self.segment = segment
+        self.origin = origin
+        self.loop = asyncio.get_running_loop()
+        self.wake = asyncio.Event()
+        self.pending: list[LoopEvent] = []
+        self.received = 0
+
+    def deliver(self, event: LoopEvent) -> None:
+        # pode ser chamado de outra thread (change stream); o Event do asyncio só é tocado no loop dele
+        self.loop.call_soon_threadsafe(self._deliver, event)
+
+    def _deliver(self, event: LoopEvent) -> None:
+        self.pending.append(event)
+        self.received += 1
+        self.wake.set()
+
+    async def wait(self) -> list[LoopEvent]:
+        await self.wake.wait()
+        return self.drain()
+
+    def drain(self) -> list[LoopEvent]:
+        self.wake.clear()
+        events, self.pending = self.pending, []
+        return events
+
+    def close(self) -> None:
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    # barramento em memória do processo: alimentado pelo Repository (insert_purchase_monitor, break condition)
+    # e, quando disponível, pelos change streams do Mongo com as escritas dos outros processos
+    def __init__(self, remember: int = 1024):
+        self._subscriptions: list[Subscription] = []
+        self._lock = threading.Lock()
+        # _ids gravados por este processo, para o change stream não entregar o mesmo evento duas vezes.
+        # Um documento atualizado no lugar (monitor) repete o _id: cada escrita local descarta um eco só
+        self._local_ids = deque(maxlen=remember)
+
+    def subscribe(self, segment: str = None, origin: int = None) -> Subscription:
+        subscription = Subscription(self, segment, origin)
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def publish(self, kind: str, segment: str = None, document_id=None, external: bool = False) -> None:
+        # external: escrita de outro processo, vinda do change stream
+        origin = None if external else event_origin.get()
+        if document_id is not None and not external:
+            self._local_ids.append(document_id)
+        event = LoopEvent(kind, segment, origin, document_id)
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if subscription.segment == segment and (origin is None or subscription.origin != origin):
+                subscription.deliver(event)
+
+    def is_local(self, document_id) -> bool:
+        with self._lock:
+            if document_id in self._local_ids:
+                self._local_ids.remove(document_id)
+                return True
+        return False
+
+
+class ChangeStreamSource:
+    # lê os change streams de purchase_latest e monitor em uma thread e publica no EventBus.
+    # Change streams exigem replica set (ou sharded cluster); sem isso start() devolve False e fica só o barramento
+    def __init__(self, database, bus: EventBus):
+        self.database = database
+        self.bus = bus
+        self._stream = None
+        self._thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    def start(self) -> bool:
+        pipeline = [{"$match": {"ns.coll": {"$in": list(WATCHED_COLLECTIONS)}, "operationType": {"$in": ["insert", "update", "replace"]}}}]
+        try:
+            self._stream = self.database.watch(pipeline, full_document="updateLookup")
+        except Exception as error:
+            logger.warning(f"change streams unavailable, using the in-process event bus only: {error}")
+            return False
+        self._thread = threading.Thread(target=self._run, name="change-stream", daemon=True)
+        self._thread.start()
+        logger.info(f"watching change streams on {list(WATCHED_COLLECTIONS)}")
+        return True
+
+    def _run(self) -> None:
+        try:
+            for change in self._stream:
+                document = change.get("fullDocument") or {}
+                # no ponteiro, record_id é o _id do registro de purchase_monitor
+                document_id = document.get("record_id", change["documentKey"]["_id"])
+                if self.bus.is_local(document_id):
+                    continue
+                kind, cache_key = WATCHED_COLLECTIONS[change["ns"]["coll"]]
+                segment = document.get("segment")
+                # a escrita veio de outro processo: o valor em cache deste processo ficou velho
+                knowledge_cache.invalidate(f"{segment}:{cache_key}" if segment else cache_key)
+                self.bus.publish(kind, segment, document_id, external=True)
+        except Exception as error:
+            if not self._stopped.is_set():
+                logger.error(f"change stream stopped: {error}")
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._stream is not None:
+            self._stream.close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+event_bus = EventBus()
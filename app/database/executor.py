@@ -0,0 +1,32 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+import settings
+
+
+class DatabaseExecutor:
+    # pymongo é bloqueante: as chamadas rodam em um pool de threads limitado para não travar o event loop
+    _pool: ThreadPoolExecutor | None = None
+
+    @classmethod
+    def get_pool(cls) -> ThreadPoolExecutor:
+        if cls._pool is None:
+            cls._pool = ThreadPoolExecutor(max_workers=settings.MONGO["EXECUTOR_WORKERS"], thread_name_prefix="mongo")
+        return cls._pool
+
+    @classmethod
+    async def run(cls, function, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(cls.get_pool(), partial(function, *args, **kwargs))
+
+    @classmethod
+    def shutdown(cls) -> None:
+        if cls._pool is not None:
+            cls._pool.shutdown(wait=True)
+            cls._pool = None
+
+
+def read_batch(cursor, batch_size: int, build) -> list:
+    # consome até batch_size documentos do cursor, convertidos por build (ex.: ClientSchema.model_validate)
+    return [build(document) for document in islice(cursor, batch_size)]
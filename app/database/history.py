@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+from loguru import logger
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, OperationFailure
+import settings
+
+# histórico do purchase_monitor: registros brutos (time-series), ponteiro para o último registro de cada
+# segmento (purchase_latest) e agregados por minuto/hora (purchase_rollups) mantidos a cada round
+GRANULARITIES = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1)}
+DUPLICATE_KEY = 11000
+
+
+def ensure_purchase_history(database) -> None:
+    # a coleção time-series precisa ser criada antes do primeiro insert; uma coleção comum já existente
+    # continua como está e só recebe o índice TTL se RETENTION_DAYS for definido explicitamente
+    retention = settings.PURCHASE_HISTORY["RETENTION_DAYS"] * 86400
+    if "purchase_monitor" not in database.list_collection_names():
+        if settings.PURCHASE_HISTORY["TIMESERIES"]:
+            options = {"timeseries": {"timeField": "updated_at", "metaField": "segment", "granularity": "seconds"}}
+            if retention:
+                options["expireAfterSeconds"] = retention
+            try:
+                database.create_collection("purchase_monitor", **options)
+                logger.info("purchase_monitor created as a time-series collection")
+                return
+            except (CollectionInvalid, OperationFailure, NotImplementedError) as error:
+                logger.warning(f"could not create purchase_monitor as time-series, using a regular collection: {error}")
+    if retention and not _is_timeseries(database):
+        database.purchase_monitor.create_index([("updated_at", 1)], name="updated_at_ttl", expireAfterSeconds=retention)
+
+
+def _is_timeseries(database) -> bool:
+    try:
+        for collection in database.list_collections(filter={"name": "purchase_monitor"}):
+            return collection.get("type") == "timeseries"
+    except (OperationFailure, NotImplementedError):
+        pass
+    return False
+
+
+def latest_key(segment: str = None) -> str:
+    return segment or ""
+
+
+def latest_pointer_update(document: dict, segment: str = None) -> tuple[dict, dict]:
+    # só substitui o ponteiro se o registro for mais novo; se o ponteiro existente for mais novo o upsert
+    # tenta inserir o mesmo _id e falha com chave duplicada, o que é ignorado em apply_updates
+    pointer = {key: value for key, value in document.items() if key != "_id"}
+    pointer["record_id"] = document["_id"]
+    return {"_id": latest_key(segment), "updated_at": {"$lte": document["updated_at"]}}, {"$set": pointer}
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(second=0, microsecond=0)
+
+
+def rollup_updates(document: dict, segment: str = None) -> list[tuple[dict, dict]]:
+    updated_at = document["updated_at"]
+    if not isinstance(updated_at, datetime):
+        return []
+    total_value = document.get("total_value") or 0
+    updates = []
+    for granularity in GRANULARITIES:
+        bucket = bucket_start(updated_at, granularity)
+        retention = timedelta(days=settings.PURCHASE_HISTORY[f"{granularity.upper()}_ROLLUP_DAYS"])
+        updates.append((
+            {"segment": segment, "granularity": granularity, "bucket": bucket},
+            {
+                "$inc": {
+                    "rounds": 1,
+                    "total_value": total_value,
+                    "total_items": document.get("total_items") or 0,
+                    "total_clients": document.get("total_clients") or 0,
+                    "sum_average_value_per_client": document.get("average_value_per_client") or 0,
+                    "sum_average_items_per_client": document.get("average_items_per_client") or 0,
+                },
+                "$min": {"min_total_value": total_value},
+                "$max": {"max_total_value": total_value, "last_updated_at": updated_at},
+                "$setOnInsert": {"expire_at": bucket + retention},
+            },
+        ))
+    return updates
+
+
+def apply_updates(collection, updates: list[tuple[dict, dict]]) -> None:
+    # upserts em um bulk_write; chave duplicada é um ponteiro que já aponta para um registro mais novo
+    if not updates:
+        return
+    try:
+        collection.bulk_write([UpdateOne(filter, update, upsert=True) for filter, update in updates], ordered=False)
+    except BulkWriteError as error:
+        if any(write_error["code"] != DUPLICATE_KEY for write_error in error.details["writeErrors"]):
+            raise
+
+
+def summarize_rollup(rollup: dict) -> dict:
+    rounds = rollup["rounds"]
+    return {
+        "segment": rollup.get("segment"),
+        "granularity": rollup["granularity"],
+        "bucket": rollup["bucket"],
+        "rounds": rounds,
+        "average_total_value": rollup["total_value"] / rounds,
+        "average_total_items": rollup["total_items"] / rounds,
+        "average_total_clients": rollup["total_clients"] / rounds,
+        "average_value_per_client": rollup["sum_average_value_per_client"] / rounds,
+        "average_items_per_client": rollup["sum_average_items_per_client"] / rounds,
+        "min_total_value": rollup["min_total_value"],
+        "max_total_value": rollup["max_total_value"],
+        "last_updated_at": rollup["last_updated_at"],
+    }
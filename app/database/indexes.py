@@ -0,0 +1,95 @@
+from loguru import logger
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from app.database.history import ensure_purchase_history
+
+# catálogo de índices do projeto, aplicado no startup da aplicação
+INDEXES = {
+    "clients": [
+        # get_client / update_client / bulk_update_clients
+        IndexModel([("client_uuid", ASCENDING)], name="client_uuid_unique", unique=True),
+        # filtro de populate_favorites (last_purchase.* $lt critério)
+        IndexModel([("last_purchase.total_value", ASCENDING)], name="last_purchase_total_value"),
+        IndexModel([("last_purchase.total_items", ASCENDING)], name="last_purchase_total_items"),
+        # filtro dos loops segmentados por classification
+        IndexModel([("classification", ASCENDING)], name="classification"),
+    ],
+    "products": [
+        IndexModel([("product_uuid", ASCENDING)], name="product_uuid_unique", unique=True),
+    ],
+    "purchase_monitor": [
+        # get_last_purchase: último registro por updated_at
+        IndexModel([("updated_at", DESCENDING)], name="updated_at_desc"),
+        # get_last_purchase por segmento (o loop global usa segment: null)
+        IndexModel([("segment", ASCENDING), ("updated_at", DESCENDING)], name="segment_updated_at_desc"),
+    ],
+    "purchase_rollups": [
+        # um agregado por (segmento, granularidade, início do intervalo); também serve o endpoint de histórico
+        IndexModel([("segment", ASCENDING), ("granularity", ASCENDING), ("bucket", ASCENDING)], name="segment_granularity_bucket_unique", unique=True),
+        IndexModel([("expire_at", ASCENDING)], name="expire_at_ttl", expireAfterSeconds=0),
+    ],
+}
+
+# estágios que leem por índice (IDHACK/EXPRESS_IXSCAN: busca por _id)
+INDEX_STAGES = {"IXSCAN", "IDHACK", "EXPRESS_IXSCAN"}
+
+# consultas quentes conferidas por explain: (nome, coleção, filtro, sort)
+HOT_QUERIES = [
+    ("get_client", "clients", {"client_uuid": ""}, None),
+    ("populate_favorites", "clients", {"$or": [{"last_purchase.total_value": {"$lt": 0}}, {"last_purchase.total_items": {"$lt": 0}}]}, None),
+    ("get_product", "products", {"product_uuid": ""}, None),
+    # get_last_purchase lê o ponteiro em purchase_latest; a consulta ordenada em purchase_monitor só roda sem ele
+    ("get_last_purchase", "purchase_latest", {"_id": ""}, None),
+    ("get_last_purchase_fallback", "purchase_monitor", {"segment": None}, [("updated_at", DESCENDING)]),
+    ("get_purchase_history", "purchase_rollups", {"segment": None, "granularity": "minute"}, [("bucket", DESCENDING)]),
+]
+
+
+def ensure_indexes(database) -> None:
+    # create_indexes é idempotente para índices com a mesma definição; um índice com erro
+    # (ex.: unique com duplicados já gravados) não impede os demais.
+    # purchase_monitor é criada antes, já que uma coleção time-series não pode ser convertida depois
+    ensure_purchase_history(database)
+    for collection, indexes in INDEXES.items():
+        for index in indexes:
+            try:
+                database[collection].create_indexes([index])
+            except OperationFailure as error:
+                logger.error(f'could not create index {index.document["name"]} on {collection}: {error}')
+        logger.info(f'indexes ensured on {collection}: {[index.document["name"] for index in indexes]}')
+
+
+def explain_hot_queries(database) -> dict:
+    report = {}
+    for name, collection, filter, sort in HOT_QUERIES:
+        cursor = database[collection].find(filter).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        stages = _plan_stages(_winning_plan(cursor.explain()))
+        report[name] = {
+            "collection": collection,
+            "stages": stages,
+            "uses_index": bool(INDEX_STAGES & set(stages)) and "COLLSCAN" not in stages,
+            "in_memory_sort": "SORT" in stages,
+        }
+    return report
+
+
+def _winning_plan(explain: dict) -> dict:
+    # numa coleção time-series o find vira uma agregação sobre os buckets: o plano fica no $cursor do
+    # primeiro estágio. Com o motor SBE o plano vem dentro de queryPlan
+    planner = explain.get("queryPlanner")
+    if planner is None:
+        planner = explain["stages"][0]["$cursor"]["queryPlanner"]
+    plan = planner["winningPlan"]
+    return plan.get("queryPlan", plan)
+
+
+def _plan_stages(plan: dict) -> list[str]:
+    stages = [plan.get("stage")]
+    if "inputStage" in plan:
+        stages += _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
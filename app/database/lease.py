@@ -0,0 +1,81 @@
+import os
+import socket
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import settings
+
+# identifica este processo nos documentos de lease (host:pid:sufixo aleatório, para pids reaproveitados)
+PROCESS_HOLDER = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:6]}"
+
+# lease do loop que está rodando no contexto atual; a UnitOfWork usa o termo dele para cercar as escritas
+current_lease: ContextVar["Lease | None"] = ContextVar("current_lease", default=None)
+
+
+class LeaseLost(RuntimeError):
+    pass
+
+
+class Lease:
+    # documento em "leases" com o dono atual, até quando a posse vale e o termo (incrementado a cada novo dono).
+    # enabled diz se o loop deve rodar em algum processo; é o que /mape/start e /mape/stop alteram.
+    # Os métodos são bloqueantes (pymongo): use via DatabaseExecutor.run
+    def __init__(self, collection, name: str, holder: str = None, ttl: float = None):
+        self.collection = collection
+        self.name = name
+        self.holder = holder or PROCESS_HOLDER
+        self.ttl = ttl or settings.MAPE["LEASE_TTL"]
+        self.term: int | None = None
+        self.expires_at: datetime | None = None
+
+    def acquire(self) -> bool:
+        # renova se o processo ainda é o dono; senão assume um lease vencido ou sem dono.
+        # Com outro dono válido o upsert tenta inserir o mesmo _id e falha com chave duplicada
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(seconds=self.ttl)
+        lease = self.collection.find_one_and_update(
+            {"_id": self.name, "holder": self.holder, "expires_at": {"$gt": now}},
+            {"$set": {"expires_at": expires_at, "renewed_at": now}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if lease is None:
+            try:
+                lease = self.collection.find_one_and_update(
+                    {"_id": self.name, "$or": [{"holder": None}, {"expires_at": {"$lte": now}}]},
+                    {"$set": {"holder": self.holder, "expires_at": expires_at, "renewed_at": now, "acquired_at": now}, "$inc": {"term": 1}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+            except DuplicateKeyError:
+                lease = None
+        if lease is None:
+            self.term = self.expires_at = None
+            return False
+        self.term = lease["term"]
+        self.expires_at = expires_at
+        return True
+
+    def release(self) -> None:
+        # libera só se ainda for o dono, para o próximo processo não esperar o ttl
+        self.collection.update_one({"_id": self.name, "holder": self.holder}, {"$set": {"holder": None, "expires_at": datetime.now(timezone.utc)}})
+        self.term = self.expires_at = None
+
+    def set_enabled(self, enabled: bool) -> None:
+        self.collection.update_one({"_id": self.name}, {"$set": {"enabled": enabled}}, upsert=True)
+
+    def read(self) -> dict:
+        return self.collection.find_one({"_id": self.name}) or {"_id": self.name}
+
+    def check(self, term: int = None) -> bool:
+        # confere no banco que o processo ainda é o dono no termo dado (o atual por padrão) e dentro do prazo
+        term = term if term is not None else self.term
+        if term is None:
+            return False
+        filter = {"_id": self.name, "holder": self.holder, "term": term, "expires_at": {"$gt": datetime.now(timezone.utc)}}
+        return self.collection.find_one(filter, {"_id": 1}) is not None
+
+    def is_held(self, margin: float = 0) -> bool:
+        # posse local ainda dentro do prazo (sem ir ao banco); com margin, por pelo menos mais margin segundos
+        return self.expires_at is not None and datetime.now(timezone.utc) + timedelta(seconds=margin) < self.expires_at
@@ -1,80 +1,266 @@
+import asyncio
 from datetime import datetime
+import settings
+from time import perf_counter
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
 from app.bootstrap import ApplicationBootstrap
+from app.database.cache import client_cache, knowledge_cache
+from app.database.events import event_bus
+from app.database.executor import DatabaseExecutor, read_batch
+from app.database.history import apply_updates, latest_key, latest_pointer_update, rollup_updates, summarize_rollup
+from app.database.unit_of_work import current_unit_of_work
 from app.database.schema import BreakCondition, ClientSchema, GoalsSchema, ProductSchema, PurchaseSchema, SymptomSchema
+from app.metrics import database_operation, observe_batch
 
 class Repository:
-    def __init__(self):
-        self.client = ApplicationBootstrap().get_mongo_client().clients
-        self.product = ApplicationBootstrap().get_mongo_client().products
-        self.monitor = ApplicationBootstrap().get_mongo_client().monitor
-        self.purchase_monitor = ApplicationBootstrap().get_mongo_client().purchase_monitor
-        self.symptom = ApplicationBootstrap().get_mongo_client().symptom
-        self.goals = ApplicationBootstrap().get_mongo_client().goals
+    def __init__(self, database=None, segment: str = None):
+        # segment separa goals/symptom/monitor/purchase_monitor de um loop segmentado; None é o loop global
+        self.segment = segment
+        if database is None:
+            database = ApplicationBootstrap().get_mongo_client()
+        self.client = database.clients
+        self.product = database.products
+        self.monitor = database.monitor
+        self.purchase_monitor = database.purchase_monitor
+        self.purchase_latest = database.purchase_latest
+        self.purchase_rollups = database.purchase_rollups
+        self.symptom = database.symptom
+        self.goals = database.goals
+        self.round_state = database.round_state
 
+    @property
+    def _knowledge_filter(self) -> dict:
+        # {"segment": None} também casa com os documentos antigos, gravados sem o campo
+        return {"segment": self.segment}
+
+    def _key(self, name: str) -> str:
+        return f"{self.segment}:{name}" if self.segment else name
+
+    async def _set_fields(self, collection, fields: dict) -> None:
+        # $set no documento do segmento; dentro de uma UnitOfWork fica para o próximo flush
+        unit_of_work = current_unit_of_work.get()
+        if unit_of_work is not None:
+            unit_of_work.set_fields(collection, fields, self._knowledge_filter)
+        else:
+            await DatabaseExecutor.run(collection.update_one, self._knowledge_filter, {"$set": fields})
+
+    def _with_segment(self, document: dict) -> dict:
+        if self.segment:
+            document["segment"] = self.segment
+        return document
+
+    @database_operation
     def get_client(self, **kwargs) -> ClientSchema:
         client = self.client.find_one(kwargs)
         client = ClientSchema(**client)
         return client
 
+    @database_operation
+    async def get_clients(self, client_uuids: list[str]) -> list[ClientSchema]:
+        # clientes encontrados entre client_uuids, em uma única consulta
+        return await DatabaseExecutor.run(lambda: [ClientSchema(**client) for client in self.client.find({"client_uuid": {"$in": client_uuids}})])
+
+    @database_operation
     async def update_client(self, **kwargs) -> bool:
-        filter = {"client_uuid": kwargs["client_uuid"]}
+        # kwargs traz só os campos a gravar (o round já descartou os que não mudaram); client_uuid fica no filtro
+        filter = {"client_uuid": kwargs.pop("client_uuid")}
+        if not kwargs:
+            return False
         new_values = {"$set": kwargs}
-        self.client.update_one(filter, new_values)
+        await DatabaseExecutor.run(self.client.update_one, filter, new_values)
+        client_cache.invalidate([filter["client_uuid"]])
         return True
 
+    @database_operation
+    async def bulk_update_clients(self, updates: list[tuple[str, dict]], ordered: bool = False) -> dict:
+        # updates: [(client_uuid, campos para $set), ...] enviados em um único bulk_write
+        operations = [UpdateOne({"client_uuid": client_uuid}, {"$set": fields}) for client_uuid, fields in updates]
+        start = perf_counter()
+        result = await DatabaseExecutor.run(self.client.bulk_write, operations, ordered=ordered)
+        client_cache.invalidate(client_uuid for client_uuid, _ in updates)
+        return {
+            "operations": len(operations),
+            "matched": result.matched_count,
+            "modified": result.modified_count,
+            "elapsed_ms": round((perf_counter() - start) * 1000, 3),
+        }
+
+    @database_operation
+    async def bump_favorites_version(self) -> int:
+        # contador global de rounds de favoritos e inserções de clientes (qualquer processo); o estado incremental
+        # compara com ele para saber se outro processo alterou clientes que as suas marcas locais não cobrem
+        state = await DatabaseExecutor.run(self.round_state.find_one_and_update, {"_id": "favorites"}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER)
+        return state["version"]
+
+    @database_operation
+    async def get_favorites_version(self) -> int:
+        state = await DatabaseExecutor.run(self.round_state.find_one, {"_id": "favorites"})
+        return state["version"] if state else 0
+
+    @database_operation
     async def get_all_clients(self) -> list[ClientSchema]:
-        clients = self.client.find()
-        return [ClientSchema(**client) for client in clients]
+        return await DatabaseExecutor.run(lambda: [ClientSchema(**client) for client in self.client.find()])
+
+    async def iter_clients(self, filter: dict = None, batch_size: int = None, projection: dict = None, build=ClientSchema.model_validate):
+        # lotes de clientes lidos de um único cursor; só um lote fica em memória por vez.
+        # Com projection, use um read model enxuto em build (ex.: ClientPurchaseView.model_validate)
+        batch_size = batch_size or settings.MONGO["CURSOR_BATCH_SIZE"]
+        cursor = self.client.find(filter or {}, projection, batch_size=batch_size)
+        try:
+            while True:
+                start = perf_counter()
+                clients = await DatabaseExecutor.run(read_batch, cursor, batch_size, build)
+                observe_batch(self, "iter_clients", start, len(clients))
+                if not clients:
+                    break
+                yield clients
+        finally:
+            cursor.close()
     
+    @database_operation
     async def get_all_products(self) -> dict:
-        products = self.product.find()
-        return [ProductSchema(**product) for product in products]
+        return await DatabaseExecutor.run(lambda: [ProductSchema(**product) for product in self.product.find()])
 
+    @database_operation
     def get_product(self, **kwargs) -> ProductSchema:
         product = self.product.find_one(kwargs)
         product = ProductSchema(**product)
         return product
 
+    @database_operation(documents=lambda result, data: len(data))
     async def populate_client(self, data):
-        self.client.insert_many(data)
+        await DatabaseExecutor.run(self.client.insert_many, data)
         return True
     
+    @database_operation(documents=lambda result, data: len(data))
     async def populate_product(self, data):
-        self.product.insert_many(data)
+        await DatabaseExecutor.run(self.product.insert_many, data)
         return True
     
     async def get_break_condition(self):
-        break_condition = self.monitor.find_one()
-        return BreakCondition(**break_condition)
+        # os getters do estado do loop só medem a leitura no banco; acertos do knowledge_cache não contam
+        break_condition = knowledge_cache.get(self._key("monitor"))
+        if break_condition is None:
+            start = perf_counter()
+            document = await DatabaseExecutor.run(self.monitor.find_one, self._knowledge_filter)
+            observe_batch(self, "get_break_condition", start, 1)
+            break_condition = BreakCondition(**document)
+            knowledge_cache.set(self._key("monitor"), break_condition)
+        return break_condition
     
+    @database_operation
     async def cancel_break_condition(self):
-        self.monitor.update_one({}, {"$set": {"break_condition": False, "updated_at": datetime.now()}})
+        updated_at = datetime.now()
+        fields = {"break_condition": False, "updated_at": updated_at}
+        # o evento leva o _id do documento, para o change stream reconhecer o eco desta escrita
+        if current_unit_of_work.get() is None:
+            document = await DatabaseExecutor.run(self.monitor.find_one_and_update, self._knowledge_filter, {"$set": fields}, projection={"_id": 1})
+        else:
+            await self._set_fields(self.monitor, fields)
+            document = await DatabaseExecutor.run(self.monitor.find_one, self._knowledge_filter, {"_id": 1})
+        break_condition = knowledge_cache.peek(self._key("monitor"))
+        if break_condition is not None:
+            knowledge_cache.set(self._key("monitor"), break_condition.model_copy(update={"break_condition": False, "updated_at": updated_at}))
+        event_bus.publish("break_condition", self.segment, document["_id"] if document else None)
         return True
 
     async def get_last_purchase(self):
-        purchase = self.purchase_monitor.find()
-        last_purchase = next(purchase.sort("updated_at", -1).limit(1))
-        return PurchaseSchema(**last_purchase)
+        last_purchase = knowledge_cache.get(self._key("last_purchase"))
+        if last_purchase is None:
+            start = perf_counter()
+            # o ponteiro purchase_latest evita ordenar o histórico; sem ele (dados antigos) cai na consulta ordenada
+            document = await DatabaseExecutor.run(self.purchase_latest.find_one, {"_id": latest_key(self.segment)})
+            if document is None:
+                document = await DatabaseExecutor.run(self.purchase_monitor.find_one, self._knowledge_filter, sort=[("updated_at", -1)])
+            observe_batch(self, "get_last_purchase", start, 1)
+            last_purchase = PurchaseSchema(**document)
+            knowledge_cache.set(self._key("last_purchase"), last_purchase)
+        return last_purchase
 
+    @database_operation
     async def insert_symptom(self, symptom: SymptomSchema):
-        self.symptom.insert_one(symptom.model_dump())
+        await DatabaseExecutor.run(self.symptom.insert_one, self._with_segment(symptom.model_dump()))
+        knowledge_cache.invalidate(self._key("symptom"))
         return True
     
+    @database_operation
     async def insert_break_condition(self, break_state: BreakCondition):
-        self.monitor.insert_one(break_state.to_dict())
+        document = self._with_segment(break_state.to_dict())
+        await DatabaseExecutor.run(self.monitor.insert_one, document)
+        knowledge_cache.invalidate(self._key("monitor"))
+        event_bus.publish("break_condition", self.segment, document["_id"])
         return True
     
+    @database_operation
+    async def update_goals(self, goals: GoalsSchema):
+        await self._set_fields(self.goals, goals.model_dump())
+        knowledge_cache.set(self._key("goals"), goals)
+        return True
+
     async def get_goals(self) -> GoalsSchema:
-        goals = self.goals.find_one()
-        return GoalsSchema(**goals)
+        goals = knowledge_cache.get(self._key("goals"))
+        if goals is None:
+            start = perf_counter()
+            document = await DatabaseExecutor.run(self.goals.find_one, self._knowledge_filter)
+            observe_batch(self, "get_goals", start, 1)
+            goals = GoalsSchema(**document)
+            knowledge_cache.set(self._key("goals"), goals)
+        return goals
     
+    @database_operation
     async def update_symptom(self, symptom: SymptomSchema):
-        self.symptom.update_one({}, {"$set": {"update_symptom": symptom.update_symptom, "symptoms": symptom.symptoms}})
+        # sintoma igual ao que já está gravado não gera escrita
+        if knowledge_cache.peek(self._key("symptom")) == symptom:
+            return False
+        await self._set_fields(self.symptom, {"update_symptom": symptom.update_symptom, "symptoms": symptom.symptoms})
+        knowledge_cache.set(self._key("symptom"), symptom)
+        return True
     
     async def get_symptom(self) -> SymptomSchema:
-        symptom = self.symptom.find_one()
-        return SymptomSchema(**symptom)
+        symptom = knowledge_cache.get(self._key("symptom"))
+        if symptom is None:
+            start = perf_counter()
+            document = await DatabaseExecutor.run(self.symptom.find_one, self._knowledge_filter)
+            observe_batch(self, "get_symptom", start, 1)
+            symptom = SymptomSchema(**document)
+            knowledge_cache.set(self._key("symptom"), symptom)
+        return symptom
     
+    @database_operation
     async def insert_purchase_monitor(self, purchase: PurchaseSchema):
-        self.purchase_monitor.insert_one(purchase.model_dump())
+        # _id gerado aqui para o change stream reconhecer o registro como deste processo
+        document = self._with_segment({"_id": ObjectId(), **purchase.model_dump()})
+        pointer = [latest_pointer_update(document, self.segment)]
+        rollups = rollup_updates(document, self.segment)
+        unit_of_work = current_unit_of_work.get()
+        if unit_of_work is not None:
+            unit_of_work.insert(self.purchase_monitor, document)
+            unit_of_work.upsert(self.purchase_latest, pointer)
+            unit_of_work.upsert(self.purchase_rollups, rollups)
+        else:
+            await asyncio.gather(
+                DatabaseExecutor.run(self.purchase_monitor.insert_one, document),
+                DatabaseExecutor.run(apply_updates, self.purchase_latest, pointer),
+                DatabaseExecutor.run(apply_updates, self.purchase_rollups, rollups),
+            )
+        # o cache só aponta para o registro novo se ele for de fato o mais recente por updated_at
+        cached = knowledge_cache.peek(self._key("last_purchase"))
+        if cached is not None and isinstance(purchase.updated_at, datetime) and isinstance(cached.updated_at, datetime) and purchase.updated_at >= cached.updated_at:
+            knowledge_cache.set(self._key("last_purchase"), purchase)
+        else:
+            knowledge_cache.invalidate(self._key("last_purchase"))
+            # a próxima leitura vai ao banco, então o registro não pode ficar só no buffer
+            if unit_of_work is not None:
+                await unit_of_work.flush()
+        event_bus.publish("purchase", self.segment, document["_id"])
         return True
+
+    @database_operation
+    async def get_purchase_history(self, granularity: str = "minute", start: datetime = None, end: datetime = None, limit: int = 1000) -> list[dict]:
+        # série do segmento a partir dos rollups, sem varrer os registros brutos
+        filter = {"segment": self.segment, "granularity": granularity}
+        if start or end:
+            filter["bucket"] = {**({"$gte": start} if start else {}), **({"$lte": end} if end else {})}
+        rollups = await DatabaseExecutor.run(lambda: list(self.purchase_rollups.find(filter, {"_id": 0}).sort("bucket", -1).limit(limit)))
+        return [summarize_rollup(rollup) for rollup in reversed(rollups)]
@@ -101,3 +101,41 @@ class GoalsSchema(BaseModel):
 class SymptomSchema(BaseModel):
     update_symptom: bool = False
     symptoms: list = []
+
+
+# read models enxutos para os hot paths (purchase_round / populate_favorites), lidos com projeção.
+# Validar só estes campos custa uma fração do ClientSchema completo, que continua sendo usado pela API.
+
+class FavoriteView(BaseModel):
+    name: str
+    price: float
+
+
+class LastPurchaseView(BaseModel):
+    total_items: int | None = None
+    total_value: float | None = None
+
+
+class ClientPurchaseView(BaseModel):
+    client_uuid: str
+    classification: int
+    last_purchase: LastPurchaseView | None = None
+    favorites_list: list[FavoriteView] | None = None
+
+
+PURCHASE_ROUND_PROJECTION = {
+    "_id": 0,
+    "client_uuid": 1,
+    "classification": 1,
+    "favorites_list.name": 1,
+    "favorites_list.price": 1,
+    # o round compara com a compra anterior e não regrava clientes sem mudança
+    "last_purchase.total_items": 1,
+    "last_purchase.total_value": 1,
+}
+
+FAVORITES_ROUND_PROJECTION = {
+    "_id": 0,
+    "client_uuid": 1,
+    "classification": 1,
+}
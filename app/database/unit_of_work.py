@@ -0,0 +1,88 @@
+import asyncio
+from contextvars import ContextVar
+from time import perf_counter
+
+from loguru import logger
+
+from app.database.executor import DatabaseExecutor
+from app.database.history import apply_updates
+from app.database.lease import LeaseLost, current_lease
+from app.metrics import observe_batch
+
+# unidade de trabalho ativa no contexto atual (ex.: um tick do loop MAPE); fora dela o Repository grava direto
+current_unit_of_work: ContextVar["UnitOfWork | None"] = ContextVar("current_unit_of_work", default=None)
+
+
+class UnitOfWork:
+    # acumula as escritas do estado do loop (symptom, goals, monitor, histórico de compras) e as envia em flush(),
+    # uma operação por coleção, todas em paralelo. Vários $set no mesmo documento viram um só.
+    # O knowledge_cache é atualizado na hora pelo Repository, então as leituras do tick já veem os valores novos.
+    def __init__(self):
+        self._sets: dict[tuple, tuple[object, dict, dict]] = {}
+        self._inserts: dict[str, tuple[object, list[dict]]] = {}
+        self._upserts: dict[str, tuple[object, list[tuple[dict, dict]]]] = {}
+        self.writes = 0
+        self.operations = 0
+        self.flushes = 0
+        self._token = None
+
+    async def __aenter__(self) -> "UnitOfWork":
+        self._token = current_unit_of_work.set(self)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        # o cache já reflete as escritas, então mesmo com erro no tick elas são gravadas
+        current_unit_of_work.reset(self._token)
+        await self.flush()
+
+    def set_fields(self, collection, fields: dict, filter: dict = None) -> None:
+        # $set no documento de filter (um por segmento); campos repetidos ficam com o último valor
+        filter = filter or {}
+        key = (collection.name, tuple(sorted(filter.items())))
+        self._sets.setdefault(key, (collection, filter, {}))[2].update(fields)
+        self.writes += 1
+
+    def insert(self, collection, document: dict) -> None:
+        self._inserts.setdefault(collection.name, (collection, []))[1].append(document)
+        self.writes += 1
+
+    def upsert(self, collection, updates: list[tuple[dict, dict]]) -> None:
+        # (filtro, update) com upsert, enviados em um bulk_write por coleção (ex.: rollups do histórico)
+        self._upserts.setdefault(collection.name, (collection, []))[1].extend(updates)
+        self.writes += len(updates)
+
+    @property
+    def pending(self) -> int:
+        return len(self._sets) + len(self._inserts) + len(self._upserts)
+
+    async def flush(self) -> int:
+        if not self.pending:
+            return 0
+        sets, self._sets = self._sets, {}
+        inserts, self._inserts = self._inserts, {}
+        upserts, self._upserts = self._upserts, {}
+        # dentro de um loop com lease: um dono antigo (lease vencido ou com outro termo) não grava nada, e os $set
+        # levam o termo e só valem sobre documentos gravados por um termo igual ou anterior
+        lease = current_lease.get()
+        term = lease.term if lease is not None else None
+        if lease is not None and not await DatabaseExecutor.run(lease.check, term):
+            raise LeaseLost(f"lease {lease.name!r} is no longer held (term {term}), discarding {self.writes} writes")
+        if term is not None:
+            fence = {"$or": [{"lease_term": None}, {"lease_term": {"$lte": term}}]}
+            sets = {key: (collection, {**filter, **fence}, {**fields, "lease_term": term}) for key, (collection, filter, fields) in sets.items()}
+        calls = [DatabaseExecutor.run(collection.update_one, filter, {"$set": fields}) for collection, filter, fields in sets.values()]
+        calls += [DatabaseExecutor.run(collection.insert_many, documents) for collection, documents in inserts.values()]
+        calls += [DatabaseExecutor.run(apply_updates, collection, updates) for collection, updates in upserts.values()]
+        start = perf_counter()
+        results = await asyncio.gather(*calls)
+        observe_batch(self, "flush", start, len(calls))
+        if term is not None:
+            for (collection, _, _), result in zip(sets.values(), results):
+                if not result.matched_count:
+                    logger.warning(f"write to {collection.name} rejected: already written by a term newer than {term}")
+        self.operations += len(calls)
+        self.flushes += 1
+        return len(calls)
+
+    def stats(self) -> dict:
+        return {"writes": self.writes, "operations": self.operations, "flushes": self.flushes}
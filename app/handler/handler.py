@@ -1,6 +1,10 @@
+import orjson
+import settings
+from app.database.cache import client_cache
 from app.database.schema import PurchaseSchema, UpdateCriteria
+from app.service.generator import DuplicateSeedError
 from app.service.service import Service
-from fastapi import APIRouter
+from fastapi import APIRouter, Body, Header, HTTPException, Response
 from fastapi_utils.cbv import cbv
 from uuid import uuid4
 
@@ -13,22 +17,74 @@ class Effectors:
         self.service = Service()
 
     @router.post("/update_favorite_model")
-    async def update_favorite_model(self, plan: UpdateCriteria = None):
-        return await self.service.populate_favorites(plan=plan)
+    async def update_favorite_model(self, plan: UpdateCriteria = None, write_mode: str = None, shards: int = None):
+        return await self.service.populate_favorites(plan=plan, write_mode=write_mode, shards=shards)
     
     @router.post("/purchase_round")
-    async def purchase_round(self):
-        return await self.service.purchase_round()
+    async def purchase_round(self, write_mode: str = None, engine: str = None, mode: str = None, shards: int = None):
+        return await self.service.purchase_round(write_mode=write_mode, engine=engine, mode=mode, shards=shards)
     
+    @router.post("/offline_purchase_round")
+    async def offline_purchase_round(self, snapshot: str):
+        try:
+            return await self.service.offline_purchase_round(snapshot=snapshot)
+        except FileNotFoundError as error:
+            raise HTTPException(status_code=404, detail=str(error))
+        except ValueError as error:
+            raise HTTPException(status_code=422, detail=str(error))
+
+    @router.post("/export")
+    async def export(self, collections: str = None, format: str = "mmap"):
+        try:
+            return await self.service.export_snapshot(collections=collections.split(",") if collections else None, format=format)
+        except (ValueError, RuntimeError) as error:
+            raise HTTPException(status_code=422, detail=str(error))
+
     @router.post("/populate_general_data")
     async def populate_general_data(self):
         return await self.service.populate_general_data()
     
     @router.get("/client/{client_uuid}")
-    def get_client(self, client_uuid: str):
-        client = self.service.get_client(client_uuid=client_uuid)
-        return client
+    async def get_client(self, client_uuid: str, if_none_match: str | None = Header(default=None)):
+        response = (await self.service.get_client_responses([client_uuid])).get(client_uuid)
+        if response is None:
+            raise HTTPException(status_code=404, detail=f"client {client_uuid} not found")
+        body, etag = response
+        if if_none_match and _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+    @router.post("/client/batch")
+    async def get_clients(self, client_uuids: list[str] = Body(...)):
+        if len(client_uuids) > settings.CLIENT_CACHE["BATCH_LIMIT"]:
+            raise HTTPException(status_code=422, detail=f'at most {settings.CLIENT_CACHE["BATCH_LIMIT"]} client_uuids per request')
+        responses = await self.service.get_client_responses(client_uuids)
+        # os corpos já serializados são concatenados sem decodificar
+        found = [responses[client_uuid][0] for client_uuid in dict.fromkeys(client_uuids) if client_uuid in responses]
+        missing = [client_uuid for client_uuid in dict.fromkeys(client_uuids) if client_uuid not in responses]
+        body = b'{"clients":[' + b",".join(found) + b'],"missing":' + orjson.dumps(missing) + b"}"
+        return Response(content=body, media_type="application/json")
+
+    @router.get("/cache")
+    async def cache_stats(self):
+        return client_cache.stats()
     
     @router.post("/populate_client")
-    async def populate_client(self, number_of_clients: int):
-        return await self.service.populate_client(number_of_clients=number_of_clients)
+    async def populate_client(self, number_of_clients: int, seed: int = None, workers: int = None):
+        try:
+            return await self.service.populate_client(number_of_clients=number_of_clients, seed=seed, workers=workers)
+        except DuplicateSeedError as error:
+            raise HTTPException(status_code=409, detail=str(error))
+
+    @router.post("/populate_product")
+    async def populate_product(self, number_of_products: int, seed: int = None, workers: int = None):
+        try:
+            return await self.service.populate_product(number_of_products=number_of_products, seed=seed, workers=workers)
+        except DuplicateSeedError as error:
+            raise HTTPException(status_code=409, detail=str(error))
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
@@ -0,0 +1,151 @@
+import asyncio
+from bisect import bisect_left
+from functools import wraps
+from threading import Lock
+from time import perf_counter
+import settings
+
+# métricas em memória do processo, expostas em texto no formato do Prometheus por GET /metrics.
+# Cada observação é um bisect e duas somas sob um lock, para não pesar no tick do loop
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # valores dos labels -> [contagem por bucket (não acumulada) + overflow, soma, contagem]
+        self._series: dict[tuple, list] = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        if not settings.METRICS["ENABLED"]:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for label_values, (counts, total, count) in sorted(series.items()):
+            labels = _format_labels(self.labels, label_values)
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1, *label_values) -> None:
+        if not settings.METRICS["ENABLED"]:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            lines.append(f"{self.name}{{{_format_labels(self.labels, label_values)}}} {value}")
+        return lines
+
+
+def _format_labels(names: tuple[str, ...], values: tuple) -> str:
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+
+
+MAPE_PHASE_SECONDS = Histogram("mape_phase_seconds", "Duration of each MAPE phase.", ("phase", "segment"))
+MAPE_TICK_SECONDS = Histogram("mape_tick_seconds", "Duration of a full control loop tick.", ("segment",))
+DATABASE_OPERATION_SECONDS = Histogram("database_operation_seconds", "Duration of Repository/KnowledgeBase operations.", ("repository", "operation"))
+DATABASE_DOCUMENTS = Counter("database_documents_total", "Documents read or written by Repository/KnowledgeBase operations.", ("repository", "operation"))
+ROUND_CLIENTS = Counter("round_clients_processed_total", "Clients processed by service rounds.", ("round",))
+ROUND_UNCHANGED_CLIENTS = Counter("round_clients_unchanged_total", "Clients whose recomputed fields matched the stored ones and were not written.", ("round",))
+CLIENT_CACHE_REQUESTS = Counter("client_cache_requests_total", "GET /client lookups answered from the client cache (hit) or the database (miss).", ("result",))
+ROUND_SECONDS = Histogram("round_seconds", "Duration of service rounds.", ("round",))
+INCREMENTAL_CHECKS = Counter("incremental_consistency_checks_total", "Incremental purchase state compared with a full recompute (ok or mismatch).", ("result",))
+
+REGISTRY = [MAPE_PHASE_SECONDS, MAPE_TICK_SECONDS, DATABASE_OPERATION_SECONDS, DATABASE_DOCUMENTS, ROUND_CLIENTS, ROUND_UNCHANGED_CLIENTS, ROUND_SECONDS, CLIENT_CACHE_REQUESTS, INCREMENTAL_CHECKS]
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+def phase(name: str):
+    # mede um método async de uma fase do loop MAPE; o label segment vem de self.segment (vazio no loop global)
+    def decorator(function):
+        @wraps(function)
+        async def wrapper(self, *args, **kwargs):
+            start = perf_counter()
+            try:
+                return await function(self, *args, **kwargs)
+            finally:
+                segment = getattr(self, "segment", None)
+                MAPE_PHASE_SECONDS.observe(perf_counter() - start, name, segment.name if segment else "")
+        return wrapper
+    return decorator
+
+
+def _count_documents(result, *args, **kwargs) -> int:
+    if isinstance(result, bool):
+        return int(result)
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict) and "operations" in result:
+        return result["operations"]
+    return 0 if result is None else 1
+
+
+def database_operation(function=None, *, documents=_count_documents):
+    # mede um método (sync ou async) de Repository/KnowledgeBase; documents(result, *args, **kwargs)
+    # diz quantos documentos a operação leu ou gravou
+    def decorator(function):
+        def observe(self, start, result, args, kwargs):
+            labels = (type(self).__name__, function.__name__)
+            DATABASE_OPERATION_SECONDS.observe(perf_counter() - start, *labels)
+            DATABASE_DOCUMENTS.inc(documents(result, *args, **kwargs), *labels)
+
+        if asyncio.iscoroutinefunction(function):
+            @wraps(function)
+            async def wrapper(self, *args, **kwargs):
+                start = perf_counter()
+                result = await function(self, *args, **kwargs)
+                observe(self, start, result, args, kwargs)
+                return result
+        else:
+            @wraps(function)
+            def wrapper(self, *args, **kwargs):
+                start = perf_counter()
+                result = function(self, *args, **kwargs)
+                observe(self, start, result, args, kwargs)
+                return result
+        return wrapper
+    return decorator(function) if function is not None else decorator
+
+
+def observe_batch(repository, operation: str, start: float, documents: int) -> None:
+    # para geradores (iter_clients), medidos lote a lote
+    labels = (type(repository).__name__, operation)
+    DATABASE_OPERATION_SECONDS.observe(perf_counter() - start, *labels)
+    DATABASE_DOCUMENTS.inc(documents, *labels)
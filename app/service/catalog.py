@@ -0,0 +1,117 @@
+import random
+from bisect import bisect_right
+from time import monotonic
+import settings
+
+
+class ProductIndex:
+    # produtos agrupados por tamanho do nome (a regra do purchase round compara com a classification do cliente)
+    # e, dentro de cada tamanho, por categoria, marca e faixa de preço. Cada balde é uma lista com a posição
+    # de cada produto, então inserir, remover e sortear custam O(1)
+    def __init__(self, price_bands: list[float] = None):
+        self.price_bands = price_bands if price_bands is not None else settings.PRODUCT_CATALOG["PRICE_BANDS"]
+        self._products: dict[str, dict] = {}
+        self._buckets: dict[tuple, list[dict]] = {}
+        self._positions: dict[tuple, int] = {}
+        # lista do ProductCatalog da qual o índice foi montado
+        self.source: list[dict] | None = None
+
+    def __len__(self) -> int:
+        return len(self._products)
+
+    def price_band(self, price: float) -> int:
+        return bisect_right(self.price_bands, price)
+
+    def _keys(self, product: dict) -> list[tuple]:
+        length = len(product["name"])
+        return [
+            (),
+            (length,),
+            (length, "category", product.get("category")),
+            (length, "brand", product.get("brand")),
+            (length, "price_band", self.price_band(product["price"])),
+        ]
+
+    def add(self, product: dict) -> None:
+        if product["product_uuid"] in self._products:
+            self.remove(product["product_uuid"])
+        self._products[product["product_uuid"]] = product
+        for key in self._keys(product):
+            bucket = self._buckets.setdefault(key, [])
+            self._positions[key, product["product_uuid"]] = len(bucket)
+            bucket.append(product)
+
+    def remove(self, product_uuid: str) -> None:
+        # troca o produto pelo último do balde para remover sem deslocar a lista
+        product = self._products.pop(product_uuid, None)
+        if product is None:
+            return
+        for key in self._keys(product):
+            bucket = self._buckets[key]
+            position = self._positions.pop((key, product_uuid))
+            last = bucket.pop()
+            if last is not product:
+                bucket[position] = last
+                self._positions[key, last["product_uuid"]] = position
+            if not bucket:
+                del self._buckets[key]
+
+    def refresh(self, products: list[dict]) -> dict:
+        # aplica só a diferença para a lista atual do catálogo
+        current = {product["product_uuid"]: product for product in products}
+        removed = [product_uuid for product_uuid in self._products if product_uuid not in current]
+        for product_uuid in removed:
+            self.remove(product_uuid)
+        changed = [product for product_uuid, product in current.items() if self._products.get(product_uuid) != product]
+        for product in changed:
+            self.add(product)
+        return {"added_or_changed": len(changed), "removed": len(removed)}
+
+    def bucket(self, length: int = None, category: str = None, brand: str = None, price_band: int = None) -> list[dict]:
+        # balde mais específico pedido; sem filtro de tamanho é o catálogo inteiro
+        if length is None:
+            return self._buckets.get((), [])
+        if category is not None:
+            return self._buckets.get((length, "category", category), [])
+        if brand is not None:
+            return self._buckets.get((length, "brand", brand), [])
+        if price_band is not None:
+            return self._buckets.get((length, "price_band", price_band), [])
+        return self._buckets.get((length,), [])
+
+    def sample(self, length: int, k: int, **facets) -> list[dict]:
+        # nenhum produto com esse tamanho de nome: o cliente não pode comprar nada, sorteia do catálogo inteiro
+        bucket = self.bucket(length, **facets) or self.bucket(length) or self.bucket()
+        return random.choices(bucket, k=k) if bucket else []
+
+    def stats(self) -> dict:
+        lengths = {key[0]: len(bucket) for key, bucket in self._buckets.items() if len(key) == 1}
+        return {"products": len(self._products), "buckets": len(self._buckets), "by_name_length": dict(sorted(lengths.items()))}
+
+
+class ProductCatalog:
+    # lista de produtos carregada uma vez por processo e reaproveitada a cada execução do plano
+    _products: list[dict] | None = None
+    _loaded_at: float = 0
+    _index = ProductIndex()
+
+    @classmethod
+    async def get_products(cls, repository) -> list[dict]:
+        ttl = settings.PRODUCT_CATALOG["TTL"]
+        if cls._products is None or (ttl and monotonic() - cls._loaded_at > ttl):
+            cls._products = [product.model_dump() for product in await repository.get_all_products()]
+            cls._loaded_at = monotonic()
+        return cls._products
+
+    @classmethod
+    async def get_index(cls, repository) -> ProductIndex:
+        # o índice acompanha a lista: a cada recarga só os produtos novos, alterados ou removidos são reindexados
+        products = await cls.get_products(repository)
+        if cls._index.source is not products:
+            cls._index.refresh(products)
+            cls._index.source = products
+        return cls._index
+
+    @classmethod
+    def invalidate(cls) -> None:
+        cls._products = None
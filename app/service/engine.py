@@ -0,0 +1,165 @@
+from __future__ import annotations
+from datetime import datetime
+import numpy as np
+
+from app.database.schema import ClientPurchaseView, ClientSchema, PurchaseSchema
+
+
+class PurchaseResult:
+    # resultado de um lote de clientes: totais por cliente e produtos comprados
+    # (client_products, com os produtos de cada cliente, só quando pedido ao engine)
+    def __init__(self, client_uuids: list[str], total_items: list[int], total_value: list[float], products: set[str], client_products: list[set[str]] = None):
+        self.client_uuids = client_uuids
+        self.total_items = total_items
+        self.total_value = total_value
+        self.products = products
+        self.client_products = client_products
+
+    @property
+    def total_clients(self) -> int:
+        return len(self.client_uuids)
+
+
+class PurchaseTotals:
+    # totais globais acumulados lote a lote, na mesma ordem de soma do loop original
+    def __init__(self):
+        self.final_value = 0
+        self.final_items = 0
+        self.total_clients = 0
+        self.products = set()
+
+    def add(self, result: PurchaseResult) -> None:
+        # np.cumsum acumula em ordem, ao contrário de np.sum (soma em pares)
+        if result.total_clients:
+            values = np.concatenate(([self.final_value], np.asarray(result.total_value, dtype=np.float64)))
+            self.final_value = float(np.cumsum(values)[-1])
+        self.final_items += int(sum(result.total_items))
+        self.total_clients += result.total_clients
+        self.products |= result.products
+
+    def merge(self, other: PurchaseTotals) -> None:
+        # soma parciais de shards diferentes; a ordem de soma dos valores passa a ser por shard
+        self.final_value += other.final_value
+        self.final_items += other.final_items
+        self.total_clients += other.total_clients
+        self.products |= other.products
+
+    def to_dict(self) -> dict:
+        return {"final_value": self.final_value, "final_items": self.final_items, "total_clients": self.total_clients, "products": list(self.products)}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> PurchaseTotals:
+        totals = cls()
+        totals.final_value = data["final_value"]
+        totals.final_items = data["final_items"]
+        totals.total_clients = data["total_clients"]
+        totals.products = set(data["products"])
+        return totals
+
+    def to_schema(self) -> PurchaseSchema:
+        # segmento (ou snapshot) sem clientes: médias zeradas em vez de divisão por zero
+        return PurchaseSchema(
+            total_value=self.final_value,
+            total_items=self.final_items,
+            total_clients=self.total_clients,
+            average_value_per_client=self.final_value/self.total_clients if self.total_clients else 0,
+            average_items_per_client=self.final_items/self.total_clients if self.total_clients else 0,
+            diferent_products=len(self.products),
+            created_at=datetime.now(),
+            updated_at=datetime.now()
+        )
+
+
+class PythonPurchaseEngine:
+    # implementação original, cliente por cliente
+    def compute(self, clients: list[ClientSchema | ClientPurchaseView], per_client_products: bool = False) -> PurchaseResult:
+        client_uuids, items_per_client, value_per_client, products_per_client = [], [], [], []
+        diferent_products = set()
+        for client in clients:
+            total_items = 0
+            total_value = 0
+            client_products = set()
+            for item in client.favorites_list or []:
+                if len(item.name) == client.classification:
+                    total_items += 1
+                    total_value += item.price
+                    client_products.add(item.name)
+            diferent_products |= client_products
+            client_uuids.append(client.client_uuid)
+            items_per_client.append(total_items)
+            value_per_client.append(total_value)
+            products_per_client.append(client_products)
+        return PurchaseResult(client_uuids, items_per_client, value_per_client, diferent_products, products_per_client if per_client_products else None)
+
+
+class PurchaseColumns:
+    # favoritos de todos os clientes achatados em colunas; offsets[i]:offsets[i+1] são os itens do cliente i
+    def __init__(self, clients: list[ClientSchema | ClientPurchaseView]):
+        favorites = [client.favorites_list or [] for client in clients]
+        items = [item for favorites_list in favorites for item in favorites_list]
+        names = [item.name for item in items]
+        self.client_uuids = [client.client_uuid for client in clients]
+        self.classifications = np.fromiter((client.classification for client in clients), dtype=np.int64, count=len(clients))
+        self.counts = np.fromiter(map(len, favorites), dtype=np.int64, count=len(clients))
+        self.offsets = np.zeros(len(clients) + 1, dtype=np.int64)
+        np.cumsum(self.counts, out=self.offsets[1:])
+        self.name_lengths = np.fromiter(map(len, names), dtype=np.int64, count=len(names))
+        self.prices = np.fromiter((item.price for item in items), dtype=np.float64, count=len(items))
+        self.product_names, self.product_ids = np.unique(np.array(names, dtype=object), return_inverse=True)
+
+    @classmethod
+    def from_arrays(cls, client_uuids: list[str], classifications: np.ndarray, counts: np.ndarray, names: list[str], prices: np.ndarray) -> PurchaseColumns:
+        # mesmas colunas a partir de arrays já achatados (ex.: um lote de ColumnarSnapshot), sem montar os read models
+        columns = cls.__new__(cls)
+        columns.client_uuids = list(client_uuids)
+        columns.classifications = np.asarray(classifications, dtype=np.int64)
+        columns.counts = np.asarray(counts, dtype=np.int64)
+        columns.offsets = np.zeros(len(columns.client_uuids) + 1, dtype=np.int64)
+        np.cumsum(columns.counts, out=columns.offsets[1:])
+        columns.name_lengths = np.fromiter(map(len, names), dtype=np.int64, count=len(names))
+        columns.prices = np.asarray(prices, dtype=np.float64)
+        columns.product_names, columns.product_ids = np.unique(np.array(names, dtype=object), return_inverse=True)
+        return columns
+
+    def __len__(self) -> int:
+        return len(self.client_uuids)
+
+
+class NumpyPurchaseEngine:
+    # mesma regra do PythonPurchaseEngine em poucas passadas vetorizadas.
+    # A soma por cliente segue a ordem da implementação original para que os floats sejam idênticos.
+    def compute(self, clients: list[ClientSchema | ClientPurchaseView], per_client_products: bool = False) -> PurchaseResult:
+        return self.compute_columns(PurchaseColumns(clients), per_client_products)
+
+    def compute_columns(self, columns: PurchaseColumns, per_client_products: bool = False) -> PurchaseResult:
+        number_of_clients = len(columns)
+        owners = np.repeat(np.arange(number_of_clients), columns.counts)
+        matched = columns.name_lengths == columns.classifications[owners]
+        positions = np.arange(owners.size) - columns.offsets[owners]
+
+        total_items = np.bincount(owners[matched], minlength=number_of_clients)
+        total_value = np.zeros(number_of_clients, dtype=np.float64)
+        # uma passada por posição na lista de favoritos mantém a soma sequencial de cada cliente
+        for position in range(columns.counts.max(initial=0)):
+            selected = matched & (positions == position)
+            total_value[owners[selected]] += columns.prices[selected]
+
+        products = set(columns.product_names[np.unique(columns.product_ids[matched])].tolist())
+        client_products = None
+        if per_client_products:
+            client_products = [set() for _ in range(number_of_clients)]
+            for owner, name in zip(owners[matched].tolist(), columns.product_names[columns.product_ids[matched]].tolist()):
+                client_products[owner].add(name)
+        return PurchaseResult(
+            columns.client_uuids,
+            total_items.tolist(),
+            total_value.tolist(),
+            products,
+            client_products,
+        )
+
+
+PURCHASE_ENGINES = {
+    "python": PythonPurchaseEngine,
+    "numpy": NumpyPurchaseEngine,
+}
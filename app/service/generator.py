@@ -0,0 +1,165 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from uuid import UUID
+import numpy as np
+from faker import Faker
+from loguru import logger
+from pymongo.errors import BulkWriteError
+
+from app.bootstrap import ApplicationBootstrap
+from app.database.history import apply_updates, latest_pointer_update
+from app.database.schema import BreakCondition, GoalsSchema, PurchaseSchema, SymptomSchema
+
+GENDERS = ['Male', 'Female', 'Other']
+CIVIL_STATUS = ['Single', 'Married', 'Divorced', 'Widowed']
+EDUCATION_LEVELS = ['High School', 'Bachelor', 'Master', 'Doctorate']
+PAYMENT_METHODS = ['Credit Card', 'Debit Card', 'Cash', 'Online Payment']
+MUSIC_GENRES = ['Rock', 'Pop', 'Jazz', 'Classical', 'Electronic', 'Hip-Hop']
+SOCIAL_MEDIA = ['Facebook', 'Twitter', 'Instagram', 'LinkedIn', 'TikTok']
+GADGETS = ['Smartphone', 'Tablet', 'PC', 'Laptop']
+CATEGORIES = ['Books', 'Electronics', 'Food', 'Games', 'Garden', 'Health', 'Home', 'Sports', 'Toys', 'Tools']
+
+# cada bloco de linhas tem a sua semente derivada de (seed, tipo, bloco): o resultado é o mesmo
+# qualquer que seja o número de processos
+BLOCK_SIZE = 10000
+KINDS = {"clients": 0, "products": 1}
+
+
+class DuplicateSeedError(ValueError):
+    # os uuids saem da seed: repetir uma seed explícita gera de novo as mesmas linhas, que o índice único recusa
+    def __init__(self, kind: str, seed: int):
+        super().__init__(f"{kind} generated with seed {seed} already exist; use another seed or omit it")
+        self.kind = kind
+        self.seed = seed
+
+    def __reduce__(self):
+        # precisa voltar do processo do pool com a mensagem
+        return DuplicateSeedError, (self.kind, self.seed)
+
+
+class DataGenerator:
+    # dados sintéticos reprodutíveis: o Faker só monta os vocabulários; as linhas saem de sorteios vetorizados
+    def __init__(self, seed: int = 0, vocabulary_size: int = 2000):
+        self.seed = seed
+        fake = Faker()
+        fake.seed_instance(seed)
+        self.names = np.array([fake.name() for _ in range(vocabulary_size)], dtype=object)
+        self.email_users = np.array([name.lower().replace(' ', '.').replace("'", '') for name in self.names], dtype=object)
+        self.domains = np.array([fake.free_email_domain() for _ in range(50)], dtype=object)
+        self.jobs = np.array([fake.job() for _ in range(vocabulary_size)], dtype=object)
+        self.words = np.array(list(dict.fromkeys(fake.word() for _ in range(vocabulary_size))), dtype=object)
+        self.companies = np.array([fake.company() for _ in range(vocabulary_size // 4)], dtype=object)
+        self.sentences = np.array([fake.sentence() for _ in range(vocabulary_size // 4)], dtype=object)
+
+    def _rng(self, kind: str, block: int) -> np.random.Generator:
+        return np.random.default_rng([self.seed, KINDS[kind], block])
+
+    def _uuids(self, rng: np.random.Generator, size: int) -> list[str]:
+        raw = rng.bytes(16 * size)
+        return [str(UUID(bytes=raw[i * 16:(i + 1) * 16], version=4)) for i in range(size)]
+
+    def client_block(self, block: int, size: int = BLOCK_SIZE) -> list[dict]:
+        rng = self._rng("clients", block)
+        name_index = rng.integers(0, self.names.size, size)
+        hobbies = self.words[rng.integers(0, self.words.size, (size, 3))]
+        columns = {
+            "client_uuid": self._uuids(rng, size),
+            "name": self.names[name_index],
+            "email": [f"{user}{number}@{domain}" for user, number, domain in zip(self.email_users[name_index], rng.integers(1, 10000, size), self.domains[rng.integers(0, self.domains.size, size)])],
+            "gender": np.array(GENDERS, dtype=object)[rng.integers(0, len(GENDERS), size)],
+            "civil_status": np.array(CIVIL_STATUS, dtype=object)[rng.integers(0, len(CIVIL_STATUS), size)],
+            "number_of_dependents": rng.integers(0, 6, size),
+            "education_level": np.array(EDUCATION_LEVELS, dtype=object)[rng.integers(0, len(EDUCATION_LEVELS), size)],
+            "profession": self.jobs[rng.integers(0, self.jobs.size, size)],
+            "income": np.round(rng.uniform(20000, 120000, size), 2),
+            "number_of_vehicle": rng.integers(0, 4, size),
+            "number_of_properties": rng.integers(0, 4, size),
+            "payment_method": np.array(PAYMENT_METHODS, dtype=object)[rng.integers(0, len(PAYMENT_METHODS), size)],
+            "favorite_product": self.words[rng.integers(0, self.words.size, size)],
+            "hobbies": [', '.join(row) for row in hobbies],
+            "favorite_music_genre": np.array(MUSIC_GENRES, dtype=object)[rng.integers(0, len(MUSIC_GENRES), size)],
+            "favorite_brand": self.companies[rng.integers(0, self.companies.size, size)],
+            "favorite_social_media": np.array(SOCIAL_MEDIA, dtype=object)[rng.integers(0, len(SOCIAL_MEDIA), size)],
+            "gadget_used": np.array(GADGETS, dtype=object)[rng.integers(0, len(GADGETS), size)],
+            "classification": rng.integers(0, 10, size),
+        }
+        rows = _to_rows(columns, size)
+        for row in rows:
+            row["last_purchase"] = None
+            row["favorites_list"] = None
+        return rows
+
+    def product_block(self, block: int, size: int = BLOCK_SIZE) -> list[dict]:
+        rng = self._rng("products", block)
+        columns = {
+            "product_uuid": self._uuids(rng, size),
+            "name": self.words[rng.integers(0, self.words.size, size)],
+            "price": np.round(rng.uniform(1, 500, size), 2),
+            "category": np.array(CATEGORIES, dtype=object)[rng.integers(0, len(CATEGORIES), size)],
+            "brand": self.companies[rng.integers(0, self.companies.size, size)],
+            "provider": self.companies[rng.integers(0, self.companies.size, size)],
+            "description": self.sentences[rng.integers(0, self.sentences.size, size)],
+        }
+        return _to_rows(columns, size)
+
+
+def _blocks(total: int) -> list[tuple[int, int]]:
+    # (bloco, tamanho) cobrindo total linhas
+    return [(block, min(BLOCK_SIZE, total - block * BLOCK_SIZE)) for block in range((total + BLOCK_SIZE - 1) // BLOCK_SIZE)]
+
+
+def _to_rows(columns: dict, size: int) -> list[dict]:
+    # colunas numpy -> documentos com tipos nativos do Python (o bson não codifica numpy)
+    names = list(columns)
+    values = [column.tolist() if isinstance(column, np.ndarray) else column for column in columns.values()]
+    return [dict(zip(names, row)) for row in zip(*values)] if size else []
+
+
+def insert_blocks(kind: str, seed: int, blocks: list[tuple[int, int]], insert_batch_size: int) -> int:
+    # roda em um processo do pool (ou inline): gera e insere os blocos em lotes, sem acumular em memória
+    generator = DataGenerator(seed)
+    collection = ApplicationBootstrap().get_mongo_client()[kind]
+    build = generator.client_block if kind == "clients" else generator.product_block
+    inserted = 0
+    for block, size in blocks:
+        rows = build(block, size)
+        for start in range(0, len(rows), insert_batch_size):
+            try:
+                collection.insert_many(rows[start:start + insert_batch_size], ordered=False)
+            except BulkWriteError as error:
+                if any(write_error.get("code") == 11000 for write_error in error.details.get("writeErrors", [])):
+                    raise DuplicateSeedError(kind, seed) from None
+                raise
+        inserted += len(rows)
+    return inserted
+
+
+def populate(kind: str, total: int, seed: int, workers: int, insert_batch_size: int) -> dict:
+    start = perf_counter()
+    blocks = _blocks(total)
+    if workers <= 1 or len(blocks) <= 1:
+        inserted = insert_blocks(kind, seed, blocks, insert_batch_size)
+    else:
+        # spawn: cada processo abre o seu próprio MongoClient em vez de herdar o do pai
+        shards = [blocks[shard::workers] for shard in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            inserted = sum(pool.map(insert_blocks, [kind] * workers, [seed] * workers, shards, [insert_batch_size] * workers))
+    elapsed = perf_counter() - start
+    rows_per_second = inserted / elapsed if elapsed else None
+    logger.info(f'{inserted} {kind} generated with seed {seed} in {elapsed:.2f}s ({rows_per_second:.0f} rows/s, {workers} workers)')
+    return {"kind": kind, "inserted": inserted, "seed": seed, "workers": workers, "elapsed_s": round(elapsed, 3), "rows_per_second": round(rows_per_second or 0, 1)}
+
+
+def seed_baseline(database, segment: str = None) -> None:
+    # documentos iniciais do loop MAPE (global ou de um segmento): só são criados se ainda não existirem
+    filter = {"segment": segment}
+    baseline = PurchaseSchema(total_items=10, total_value=1000, total_clients=100, average_value_per_client=10, average_items_per_client=0.10, diferent_products=0)
+    goals = GoalsSchema(**baseline.model_dump(include=set(GoalsSchema.model_fields)))
+    database.goals.update_one(filter, {"$setOnInsert": goals.model_dump()}, upsert=True)
+    database.symptom.update_one(filter, {"$setOnInsert": SymptomSchema().model_dump()}, upsert=True)
+    database.monitor.update_one(filter, {"$setOnInsert": BreakCondition().to_dict()}, upsert=True)
+    if database.purchase_monitor.find_one(filter, {"_id": 1}) is None:
+        document = {**baseline.model_dump(), **filter}
+        database.purchase_monitor.insert_one(document)
+        apply_updates(database.purchase_latest, [latest_pointer_update(document, segment)])
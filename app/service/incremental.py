@@ -0,0 +1,107 @@
+from collections import Counter
+from math import isclose
+from threading import Lock
+from loguru import logger
+
+from app.metrics import INCREMENTAL_CHECKS
+from app.service.engine import PurchaseResult, PurchaseTotals
+
+
+class IncrementalPurchaseState:
+    # contribuição de cada cliente para o purchase round e os agregados globais correntes.
+    # Um round incremental só recalcula os clientes marcados como alterados desde o último round.
+    def __init__(self):
+        self.ready = False
+        self.contributions: dict[str, tuple[int, float, frozenset]] = {}
+        self.final_items = 0
+        self.final_value = 0.0
+        # quantos clientes compram cada produto; diferent_products é o número de chaves
+        self.product_counts: Counter = Counter()
+        self.rounds_since_rebuild = 0
+        # versão de favoritos (Repository.bump_favorites_version) que o estado cobre; as marcas de dirty são
+        # só deste processo, então uma versão diferente no banco significa escrita de outro processo
+        self.favorites_version: int | None = None
+        self._dirty: set[str] = set()
+        self._lock = Lock()
+
+    def apply(self, result: PurchaseResult) -> None:
+        for client_uuid, total_items, total_value, products in zip(result.client_uuids, result.total_items, result.total_value, result.client_products):
+            self.remove(client_uuid)
+            products = frozenset(products)
+            self.contributions[client_uuid] = (total_items, total_value, products)
+            self.final_items += total_items
+            self.final_value += total_value
+            self.product_counts.update(products)
+
+    def remove(self, client_uuid: str) -> None:
+        previous = self.contributions.pop(client_uuid, None)
+        if previous is None:
+            return
+        total_items, total_value, products = previous
+        self.final_items -= total_items
+        self.final_value -= total_value
+        self.product_counts.subtract(products)
+        for product in products:
+            if self.product_counts[product] <= 0:
+                del self.product_counts[product]
+
+    def mark_dirty(self, client_uuids) -> None:
+        with self._lock:
+            self._dirty.update(client_uuids)
+
+    def take_dirty(self) -> list[str]:
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        return list(dirty)
+
+    def record_own_write(self, version: int) -> None:
+        # round de favoritos deste processo: as marcas locais cobrem a nova versão só se nenhuma outra
+        # escrita aconteceu entre a versão do estado e esta
+        with self._lock:
+            if self.favorites_version is not None and version == self.favorites_version + 1:
+                self.favorites_version = version
+            else:
+                self.ready = False
+
+    def covers(self, version: int) -> bool:
+        return self.ready and self.favorites_version == version
+
+    def invalidate(self) -> None:
+        # próximo round incremental volta a ser completo (ex.: clientes inseridos ou removidos)
+        self.ready = False
+
+    def replace(self, rebuilt: "IncrementalPurchaseState", favorites_version: int | None = None) -> None:
+        # troca o estado por um recalculado do zero, conferindo se o incremental estava consistente.
+        # favorites_version é a versão lida antes do round que reconstruiu o estado
+        if self.ready:
+            consistent = self.matches(rebuilt)
+            INCREMENTAL_CHECKS.inc(1, "ok" if consistent else "mismatch")
+            log = logger.info if consistent else logger.warning
+            log(f'incremental purchase state consistency check: {"ok" if consistent else "mismatch, state rebuilt"}')
+        self.favorites_version = favorites_version
+        self.contributions = rebuilt.contributions
+        self.final_items = rebuilt.final_items
+        self.final_value = rebuilt.final_value
+        self.product_counts = rebuilt.product_counts
+        self.rounds_since_rebuild = 0
+        self.ready = True
+
+    def matches(self, other: "IncrementalPurchaseState") -> bool:
+        # a soma corrente acumula erro de arredondamento ao subtrair e somar contribuições
+        return (
+            self.final_items == other.final_items
+            and len(self.contributions) == len(other.contributions)
+            and set(self.product_counts) == set(other.product_counts)
+            and isclose(self.final_value, other.final_value, rel_tol=1e-9, abs_tol=1e-6)
+        )
+
+    def to_totals(self) -> PurchaseTotals:
+        totals = PurchaseTotals()
+        totals.final_items = self.final_items
+        totals.final_value = self.final_value
+        totals.total_clients = len(self.contributions)
+        totals.products = set(self.product_counts)
+        return totals
+
+
+purchase_state = IncrementalPurchaseState()
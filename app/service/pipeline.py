@@ -0,0 +1,26 @@
+import asyncio
+
+
+class WriteBehind:
+    # mantém no máximo uma escrita em andamento enquanto o próximo lote é lido e calculado
+    def __init__(self):
+        self.pending: asyncio.Task | None = None
+        self.reports: list[dict] = []
+
+    async def submit(self, write) -> None:
+        await self.drain()
+        self.pending = asyncio.create_task(write)
+
+    async def drain(self) -> None:
+        if self.pending is not None:
+            pending, self.pending = self.pending, None
+            self.reports.extend(await pending)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            await self.drain()
+        elif self.pending is not None:
+            self.pending.cancel()
@@ -0,0 +1,23 @@
+import json
+import settings
+
+
+class Segment:
+    # fatia da base de clientes com o seu próprio loop MAPE (goals/symptom/monitor/purchase_monitor próprios)
+    def __init__(self, name: str, filter: dict):
+        self.name = name
+        self.filter = filter
+
+    def __repr__(self) -> str:
+        return f"Segment({self.name!r}, {self.filter!r})"
+
+
+def configured_segments(spec: str = None) -> list[Segment]:
+    # "classification" -> um segmento por classification (0 a 9);
+    # um objeto JSON {"nome": filtro do Mongo, ...} -> segmentos arbitrários; vazio -> nenhum
+    spec = settings.MAPE["SEGMENTS"] if spec is None else spec
+    if not spec:
+        return []
+    if spec == "classification":
+        return [Segment(f"classification-{classification}", {"classification": classification}) for classification in range(10)]
+    return [Segment(name, filter) for name, filter in json.loads(spec).items()]
@@ -1,72 +1,233 @@
 
 from loguru import logger
+import asyncio
+import orjson
+import os
+from datetime import datetime
+from hashlib import blake2b
+import settings
+from app.bootstrap import ApplicationBootstrap
+from app.database.cache import client_cache
+from app.database.columnar import ColumnarSnapshot, export_snapshot
+from app.database.executor import DatabaseExecutor
 from app.database.repository import Repository
-from faker import Faker
+from app.metrics import CLIENT_CACHE_REQUESTS, ROUND_CLIENTS, ROUND_SECONDS, ROUND_UNCHANGED_CLIENTS
+from app.service.catalog import ProductCatalog
+from app.service.generator import populate, seed_baseline
+from app.service.engine import PURCHASE_ENGINES, NumpyPurchaseEngine, PurchaseColumns, PurchaseResult, PurchaseTotals
+from app.service.incremental import IncrementalPurchaseState, purchase_state
+from app.service.pipeline import WriteBehind
+from app.service.sharding import ShardPool, shard_filters
+import numpy as np
 import random
-from datetime import datetime
+from time import perf_counter
+from uuid import uuid4
 
-from app.database.schema import BreakCondition, ClientSchema, PurchaseSchema, SymptomSchema, UpdateCriteria
+from app.database.schema import FAVORITES_ROUND_PROJECTION, PURCHASE_ROUND_PROJECTION, BreakCondition, ClientPurchaseView, PurchaseSchema, SymptomSchema, UpdateCriteria
 
 
 class Service:
-    def __init__(self):
-        self.repository = Repository()
+    def __init__(self, repository: Repository = None, filter: dict = None):
+        self.repository = repository or Repository()
+        # filtro de clientes de um loop segmentado; os rounds só leem e gravam os clientes do segmento
+        self.filter = filter or {}
     
-    async def populate_favorites(self, plan: UpdateCriteria = None):
-        clients = await self.repository.get_all_clients()
-        products = await self.repository.get_all_products()
-        number_of_changes = 0
-        for client in clients:
-            must_update = await self._check_update_necessity(client, plan)
-            if must_update:
-                client.favorites_list = random.choices(products, k=5)
-                await self.repository.update_client(**client.dict())
-                number_of_changes += 1
+    async def populate_favorites(self, plan: UpdateCriteria = None, write_mode: str = None, shards: int = None):
+        start = perf_counter()
+        write_mode = write_mode or settings.PURCHASE_ROUND["WRITE_MODE"]
+        shards = shards or settings.SHARDING["SHARDS"]
+        filter = self._build_update_filter(plan)
+        if filter is not None:
+            filter = _combine_filters(self.filter, filter)
+        if filter is None:
+            number_of_changes = 0
+        elif shards > 1:
+            loop = asyncio.get_running_loop()
+            pool = ShardPool.get_pool(shards)
+            changes = await asyncio.gather(*(
+                loop.run_in_executor(pool, _favorites_shard, _combine_filters(filter, shard_filter), write_mode)
+                for shard_filter in shard_filters(shards)
+            ))
+            number_of_changes = sum(changes)
+            # os shards marcam os clientes alterados e invalidam o cache nos seus processos; aqui o estado
+            # incremental é refeito e o cache deste processo esvaziado
+            purchase_state.invalidate()
+            client_cache.invalidate()
+        else:
+            number_of_changes = await self._favorites_round(filter, write_mode)
+        ROUND_SECONDS.observe(perf_counter() - start, "favorites")
+        ROUND_CLIENTS.inc(number_of_changes, "favorites")
         logger.info(f"{number_of_changes} clients updated.")
         return {"number of changes": number_of_changes}
+
+    async def _favorites_round(self, filter: dict, write_mode: str) -> int:
+        if settings.PRODUCT_CATALOG["FAVORITES"] == "bucket":
+            index = await ProductCatalog.get_index(self.repository)
+            choose = lambda client: index.sample(client.classification, k=5)
+        else:
+            products = await ProductCatalog.get_products(self.repository)
+            choose = lambda client: random.choices(products, k=5)
+        number_of_changes = 0
+        async with WriteBehind() as writer:
+            async for clients in self.repository.iter_clients(filter=filter, projection=FAVORITES_ROUND_PROJECTION, build=ClientPurchaseView.model_validate):
+                updates = [(client.client_uuid, {"favorites_list": choose(client)}) for client in clients]
+                purchase_state.mark_dirty(client.client_uuid for client in clients)
+                number_of_changes += len(updates)
+                await writer.submit(self._write_clients(updates, write_mode))
+        if number_of_changes:
+            purchase_state.record_own_write(await self.repository.bump_favorites_version())
+        return number_of_changes
     
-    async def _check_update_necessity(self, client: ClientSchema, update_criteria: UpdateCriteria):
-        if update_criteria.average_value_per_client and client.last_purchase.total_value < update_criteria.average_value_per_client:
-            return True
-        if update_criteria.average_items_per_client and client.last_purchase.total_items < update_criteria.average_items_per_client:
-            return True
+    def _build_update_filter(self, update_criteria: UpdateCriteria) -> dict | None:
+        # critérios do plano como filtro do Mongo; None quando nenhum cliente precisa mudar
+        if update_criteria is None:
+            return None
         if update_criteria.total_clients and update_criteria.total_clients == 1001:
-            return True
-        return False
+            return {}
+        conditions = []
+        if update_criteria.average_value_per_client:
+            conditions.append({"last_purchase.total_value": {"$lt": update_criteria.average_value_per_client}})
+        if update_criteria.average_items_per_client:
+            conditions.append({"last_purchase.total_items": {"$lt": update_criteria.average_items_per_client}})
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$or": conditions}
     
-    async def purchase_round(self):
-        clients = await self.repository.get_all_clients()
-        final_value = 0
-        final_items = 0
-        diferent_products = set()
-        for client in clients:
-            total_items = 0
-            total_value = 0
-            for item in client.favorites_list:
-                if len(item.name) == client.classification:
-                    total_items += 1
-                    total_value += item.price
-                    diferent_products.add(item.name)
-            final_value += total_value
-            final_items += total_items
-            client.last_purchase = PurchaseSchema(total_items=total_items, total_value=total_value)
-            await self.repository.update_client(**client.dict())
-        purchase = PurchaseSchema(
-            total_value=final_value,
-            total_items=final_items,
-            total_clients=len(clients),
-            average_value_per_client=final_value/len(clients),
-            average_items_per_client=final_items/len(clients),
-            diferent_products=len(diferent_products),
-            created_at=datetime.now(),
-            updated_at=datetime.now()
-        )
+    async def purchase_round(self, write_mode: str = None, engine: str = None, mode: str = None, shards: int = None):
+        start = perf_counter()
+        write_mode = write_mode or settings.PURCHASE_ROUND["WRITE_MODE"]
+        engine_name = engine or settings.PURCHASE_ROUND["ENGINE"]
+        engine = PURCHASE_ENGINES[engine_name]()
+        mode = mode or settings.PURCHASE_ROUND["MODE"]
+        shards = shards or settings.SHARDING["SHARDS"]
+        verify_every = settings.PURCHASE_ROUND["VERIFY_EVERY"]
+        if self.filter and mode == "incremental":
+            # o estado incremental é um só por processo, para a base toda
+            mode = "full"
+        if mode == "incremental" and purchase_state.ready and not purchase_state.covers(await self.repository.get_favorites_version()):
+            # favoritos alterados por outro processo (outro worker, loop de segmento, shard): as marcas locais
+            # não cobrem esses clientes, então este round reconstrói o estado do zero
+            logger.info('favorites changed outside this process since the last round, running a full round')
+            purchase_state.invalidate()
+        if mode == "incremental" and purchase_state.ready and not (verify_every and purchase_state.rounds_since_rebuild >= verify_every):
+            # no round incremental total_clients é a base toda; os processados são só os recalculados
+            totals, write_reports = await self._incremental_purchase_round(engine, write_mode)
+        elif mode != "incremental" and shards > 1:
+            # o estado incremental vive neste processo, então só o modo full é dividido em shards
+            totals, write_reports = await self._sharded_purchase_round(shards, engine_name, write_mode)
+            ROUND_CLIENTS.inc(totals.total_clients, "purchase")
+        else:
+            totals, write_reports = await self._full_purchase_round(engine, write_mode, incremental=mode == "incremental", filter=self.filter or None)
+            ROUND_CLIENTS.inc(totals.total_clients, "purchase")
+        if write_reports:
+            elapsed_ms = sum(batch["elapsed_ms"] for batch in write_reports)
+            logger.info(f'{len(write_reports)} bulk write batches, {elapsed_ms:.2f} ms total, {elapsed_ms/len(write_reports):.2f} ms per batch')
+        purchase = totals.to_schema()
         await self.repository.insert_purchase_monitor(purchase=purchase)
-        logger.info(f'purchase round finished. Total value: {final_value:.2f}, Total items: {final_items}, Total clients: {len(clients)}')
-        logger.info(f'Average value per client: {final_value/len(clients):.2f}, Average items per client: {final_items/len(clients)}')
+        ROUND_SECONDS.observe(perf_counter() - start, "purchase")
+        logger.info(f'purchase round finished. Total value: {totals.final_value:.2f}, Total items: {totals.final_items}, Total clients: {totals.total_clients}')
+        logger.info(f'Average value per client: {purchase.average_value_per_client:.2f}, Average items per client: {purchase.average_items_per_client}')
 
         return purchase
+
+    async def offline_purchase_round(self, snapshot: str, batch_size: int = None) -> PurchaseSchema:
+        # o mesmo cálculo a partir de um snapshot colunar (app.database.columnar), sem ler nem gravar no Mongo.
+        # snapshot é o nome devolvido por /export, relativo a EXPORT_DIRECTORY
+        loop = asyncio.get_running_loop()
+        totals = await loop.run_in_executor(None, snapshot_purchase_totals, snapshot_directory(snapshot), batch_size)
+        logger.info(f'offline purchase round from {snapshot}: {totals.total_clients} clients')
+        return totals.to_schema()
+
+    async def _sharded_purchase_round(self, shards: int, engine_name: str, write_mode: str) -> tuple[PurchaseTotals, list[dict]]:
+        # cada shard lê, calcula e grava a sua faixa de client_uuid em outro processo; aqui só se juntam os parciais
+        loop = asyncio.get_running_loop()
+        pool = ShardPool.get_pool(shards)
+        partials = await asyncio.gather(*(
+            loop.run_in_executor(pool, _purchase_shard, _combine_filters(self.filter, shard_filter), engine_name, write_mode)
+            for shard_filter in shard_filters(shards)
+        ))
+        totals = PurchaseTotals()
+        write_reports = []
+        for partial in partials:
+            totals.merge(PurchaseTotals.from_dict(partial["totals"]))
+            write_reports.extend(partial["write_reports"])
+        # os shards gravaram clientes em outros processos: nenhuma chave deste cache foi invalidada
+        client_cache.invalidate()
+        logger.info(f'purchase round split across {shards} shards: {[partial["totals"]["total_clients"] for partial in partials]} clients')
+        return totals, write_reports
+
+    async def _full_purchase_round(self, engine, write_mode: str, incremental: bool = False, filter: dict = None) -> tuple[PurchaseTotals, list[dict]]:
+        # com incremental=True o round também reconstrói o estado incremental (e confere o anterior)
+        totals = PurchaseTotals()
+        rebuilt = IncrementalPurchaseState() if incremental else None
+        if incremental:
+            # lida antes dos clientes: uma escrita concorrente muda a versão e o próximo round refaz o estado
+            favorites_version = await self.repository.get_favorites_version()
+            purchase_state.take_dirty()
+        async with WriteBehind() as writer:
+            async for clients in self.repository.iter_clients(filter=filter, projection=PURCHASE_ROUND_PROJECTION, build=ClientPurchaseView.model_validate):
+                result = engine.compute(clients, per_client_products=incremental)
+                totals.add(result)
+                if incremental:
+                    rebuilt.apply(result)
+                await writer.submit(self._write_clients(self._purchase_updates(result, clients), write_mode))
+        if incremental:
+            purchase_state.replace(rebuilt, favorites_version)
+        return totals, writer.reports
+
+    async def _incremental_purchase_round(self, engine, write_mode: str) -> tuple[PurchaseTotals, list[dict]]:
+        # só os clientes alterados desde o último round são lidos, recalculados e gravados
+        dirty = purchase_state.take_dirty()
+        batch_size = settings.MONGO["CURSOR_BATCH_SIZE"]
+        async with WriteBehind() as writer:
+            for start in range(0, len(dirty), batch_size):
+                chunk = dirty[start:start + batch_size]
+                found = set()
+                async for clients in self.repository.iter_clients(filter={"client_uuid": {"$in": chunk}}, projection=PURCHASE_ROUND_PROJECTION, build=ClientPurchaseView.model_validate):
+                    result = engine.compute(clients, per_client_products=True)
+                    purchase_state.apply(result)
+                    found.update(result.client_uuids)
+                    await writer.submit(self._write_clients(self._purchase_updates(result, clients), write_mode))
+                for client_uuid in set(chunk) - found:
+                    purchase_state.remove(client_uuid)
+        purchase_state.rounds_since_rebuild += 1
+        ROUND_CLIENTS.inc(len(dirty), "purchase")
+        logger.info(f'incremental purchase round: {len(dirty)} clients recomputed')
+        return purchase_state.to_totals(), writer.reports
+
+    def _purchase_updates(self, result: PurchaseResult, clients: list[ClientPurchaseView]) -> list[tuple[str, dict]]:
+        # só os clientes cuja compra mudou em relação à lida do banco geram $set de last_purchase
+        previous = {client.client_uuid: client.last_purchase for client in clients}
+        updates = []
+        for client_uuid, total_items, total_value in zip(result.client_uuids, result.total_items, result.total_value):
+            last_purchase = previous.get(client_uuid)
+            if last_purchase is not None and last_purchase.total_items == total_items and last_purchase.total_value == total_value:
+                continue
+            updates.append((client_uuid, {"last_purchase": PurchaseSchema(total_items=total_items, total_value=total_value).model_dump()}))
+        ROUND_UNCHANGED_CLIENTS.inc(result.total_clients - len(updates), "purchase")
+        return updates
+
+    async def _write_clients(self, updates: list[tuple[str, dict]], write_mode: str) -> list[dict]:
+        # write_mode "single" mantém o caminho antigo de um update_one por cliente
+        if write_mode == "single":
+            for client_uuid, fields in updates:
+                await self.repository.update_client(client_uuid=client_uuid, **fields)
+            return []
+        batch_size = settings.PURCHASE_ROUND["BULK_BATCH_SIZE"]
+        reports = []
+        for start in range(0, len(updates), batch_size):
+            batch = await self.repository.bulk_update_clients(updates[start:start + batch_size], ordered=settings.PURCHASE_ROUND["BULK_ORDERED"])
+            logger.debug(f'bulk write batch: {batch}')
+            reports.append(batch)
+        return reports
     
+    async def export_snapshot(self, collections: list[str] = None, format: str = "mmap") -> dict:
+        # snapshot colunar em um diretório novo dentro de EXPORT_DIRECTORY; o sufixo separa exportações no mesmo segundo
+        name = f'snapshot-{datetime.now():%Y%m%d-%H%M%S}-{uuid4().hex[:8]}'
+        directory = os.path.join(settings.EXPORT["DIRECTORY"], name)
+        report = await DatabaseExecutor.run(export_snapshot, ApplicationBootstrap().get_mongo_client(), directory, collections, format, exist_ok=False)
+        return {"snapshot": name, **report}
+
     async def populate_general_data(self):
         last_purchase = PurchaseSchema(
             total_items=10,
@@ -77,6 +238,7 @@ class Service:
             diferent_products=0,
         )
         await self.repository.insert_purchase_monitor(last_purchase)
+        await DatabaseExecutor.run(seed_baseline, ApplicationBootstrap().get_mongo_client())
 
     async def check_break_condition(self) -> BreakCondition:
             return await self.repository.get_break_condition()
@@ -99,54 +261,84 @@ class Service:
     def get_client(self, client_uuid: str):
         client = self.repository.get_client(client_uuid=client_uuid)
         return client
+
+    async def get_client_responses(self, client_uuids: list[str]) -> dict[str, tuple[bytes, str]]:
+        # corpo JSON (orjson) e ETag de cada cliente encontrado; os que não estão no cache
+        # são lidos em uma única consulta e guardados já serializados
+        responses = {}
+        missing = []
+        for client_uuid in dict.fromkeys(client_uuids):
+            cached = client_cache.get(client_uuid)
+            if cached is None:
+                missing.append(client_uuid)
+            else:
+                responses[client_uuid] = cached
+        CLIENT_CACHE_REQUESTS.inc(len(responses), "hit")
+        if missing:
+            CLIENT_CACHE_REQUESTS.inc(len(missing), "miss")
+            generation = client_cache.generation
+            for client in await self.repository.get_clients(missing):
+                body = orjson.dumps(client.model_dump())
+                etag = f'"{blake2b(body, digest_size=8).hexdigest()}"'
+                client_cache.set(client.client_uuid, body, etag, generation)
+                responses[client.client_uuid] = (body, etag)
+        return responses
     
-    async def populate_client(self, number_of_clients: int):
-        fake = Faker()
-        clients_to_insert = []
-        for _ in range(number_of_clients):
-            client_uuid = fake.uuid4()
-            name = fake.name()
-            email = fake.email()
-            gender = random.choice(['Male', 'Female', 'Other'])
-            civil_status = random.choice(['Single', 'Married', 'Divorced', 'Widowed'])
-            number_of_dependents = random.randint(0, 5)
-            education_level = random.choice(['High School', 'Bachelor', 'Master', 'Doctorate'])
-            profession = fake.job()
-            income = round(random.uniform(20000, 120000), 2)
-            number_of_vehicle = random.randint(0, 3)
-            number_of_properties = random.randint(0, 3)
-            payment_method = random.choice(['Credit Card', 'Debit Card', 'Cash', 'Online Payment'])
-            favorite_product = fake.word()
-            hobbies = ', '.join(fake.words(nb=3))
-            favorite_music_genre = random.choice(['Rock', 'Pop', 'Jazz', 'Classical', 'Electronic', 'Hip-Hop'])
-            favorite_brand = fake.company()
-            favorite_social_media = random.choice(['Facebook', 'Twitter', 'Instagram', 'LinkedIn', 'TikTok'])
-            gadget_used = random.choice(['Smartphone', 'Tablet', 'PC', 'Laptop'])
-            classification = random.randint(0, 9)
-            
-            client = {
-                "client_uuid": client_uuid,
-                "name": name,
-                "email": email,
-                "gender": gender,
-                "civil_status": civil_status,
-                "number_of_dependents": number_of_dependents,
-                "education_level": education_level,
-                "profession": profession,
-                "income": income,
-                "number_of_vehicle": number_of_vehicle,
-                "number_of_properties": number_of_properties,
-                "payment_method": payment_method,
-                "favorite_product": favorite_product,
-                "last_purchase": None,
-                "favorites_list": None,
-                "hobbies": hobbies,
-                "favorite_music_genre": favorite_music_genre,
-                "favorite_brand": favorite_brand,
-                "favorite_social_media": favorite_social_media,
-                "gadget_used": gadget_used,
-                "classification": classification
-            }
-            clients_to_insert.append(client)
-        await self.repository.populate_client(clients_to_insert)
-        return {"message": f"{number_of_clients} clients inserted."}
+    async def populate_client(self, number_of_clients: int, seed: int = None, workers: int = None):
+        report = await self._populate("clients", number_of_clients, seed, workers)
+        # clientes novos mudam a base de todos os processos: a versão compartilhada avisa os estados
+        # incrementais dos outros workers, que só têm as próprias marcas
+        await self.repository.bump_favorites_version()
+        purchase_state.invalidate()
+        return {"message": f"{number_of_clients} clients inserted.", **report}
+
+    async def populate_product(self, number_of_products: int, seed: int = None, workers: int = None):
+        report = await self._populate("products", number_of_products, seed, workers)
+        ProductCatalog.invalidate()
+        return {"message": f"{number_of_products} products inserted.", **report}
+
+    async def _populate(self, kind: str, total: int, seed: int = None, workers: int = None) -> dict:
+        # sem seed explícita cada chamada sorteia uma, para não repetir client_uuid/product_uuid
+        seed = seed if seed is not None else int(np.random.SeedSequence().entropy % 2**32)
+        workers = workers or settings.GENERATOR["WORKERS"]
+        return await DatabaseExecutor.run(populate, kind, total, seed, workers, settings.GENERATOR["INSERT_BATCH_SIZE"])
+
+
+def _combine_filters(*filters: dict) -> dict:
+    filters = [filter for filter in filters if filter]
+    if not filters:
+        return {}
+    return filters[0] if len(filters) == 1 else {"$and": filters}
+
+
+def _purchase_shard(filter: dict, engine: str, write_mode: str) -> dict:
+    # roda em um processo do ShardPool
+    totals, write_reports = asyncio.run(Service()._full_purchase_round(PURCHASE_ENGINES[engine](), write_mode, filter=filter))
+    return {"totals": totals.to_dict(), "write_reports": write_reports}
+
+
+def _favorites_shard(filter: dict, write_mode: str) -> int:
+    # roda em um processo do ShardPool
+    return asyncio.run(Service()._favorites_round(filter, write_mode))
+
+
+def snapshot_directory(snapshot: str) -> str:
+    # nome de um snapshot dentro de EXPORT_DIRECTORY; caminhos que saem do diretório são recusados
+    base = os.path.realpath(settings.EXPORT["DIRECTORY"])
+    directory = os.path.realpath(os.path.join(base, snapshot))
+    if directory == base or os.path.commonpath([base, directory]) != base:
+        raise ValueError(f"snapshot must be the name of an export inside {settings.EXPORT['DIRECTORY']}")
+    return directory
+
+
+def snapshot_purchase_totals(snapshot: str, batch_size: int = None, start: int = 0, stop: int = None) -> PurchaseTotals:
+    # lê os clientes [start, stop) do snapshot em lotes e acumula os totais com o NumpyPurchaseEngine
+    table = ColumnarSnapshot(snapshot).table("clients")
+    engine = NumpyPurchaseEngine()
+    totals = PurchaseTotals()
+    columns = ["client_uuid", "classification", "favorites_list.name", "favorites_list.price"]
+    for batch in table.batches(batch_size, columns, start, stop):
+        totals.add(engine.compute_columns(PurchaseColumns.from_arrays(
+            batch["client_uuid"], batch["classification"], batch["favorites_list.counts"], batch["favorites_list.name"], batch["favorites_list.price"],
+        )))
+    return totals
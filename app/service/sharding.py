@@ -0,0 +1,38 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+class ShardPool:
+    # processos que executam as fatias (shards) de purchase_round / populate_favorites.
+    # spawn: cada processo abre o seu próprio MongoClient em vez de herdar o do pai
+    _pool: ProcessPoolExecutor | None = None
+    _workers = 0
+
+    @classmethod
+    def get_pool(cls, workers: int) -> ProcessPoolExecutor:
+        if cls._pool is None or cls._workers < workers:
+            # chamado no event loop: o pool antigo termina as tarefas já enviadas em segundo plano, sem bloquear
+            cls.shutdown(wait=False)
+            cls._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            cls._workers = workers
+        return cls._pool
+
+    @classmethod
+    def shutdown(cls, wait: bool = True) -> None:
+        if cls._pool is not None:
+            cls._pool.shutdown(wait=wait)
+            cls._pool = None
+            cls._workers = 0
+
+
+def shard_filters(shards: int) -> list[dict]:
+    # intervalos de client_uuid (uuid4, hexadecimal minúsculo) com o mesmo tamanho no espaço dos 8 primeiros dígitos;
+    # como os uuids são aleatórios isso equivale a particionar por hash, mas aproveitando o índice de client_uuid
+    bounds = [f"{shard * 2**32 // shards:08x}" for shard in range(shards)]
+    filters = []
+    for shard, lower in enumerate(bounds):
+        condition = {"$gte": lower} if shard else {}
+        if shard + 1 < shards:
+            condition["$lt"] = bounds[shard + 1]
+        filters.append({"client_uuid": condition} if condition else {})
+    return filters
@@ -0,0 +1,190 @@
+import asyncio
+from time import monotonic, perf_counter
+import numpy as np
+from loguru import logger
+import settings
+
+from app.database.schema import PURCHASE_ROUND_PROJECTION, ClientPurchaseView, GoalsSchema, UpdateCriteria
+from app.service.catalog import ProductCatalog
+from app.service.engine import NumpyPurchaseEngine, PurchaseColumns
+from app.service.sharding import ShardPool
+
+# campos de GoalsSchema na ordem das colunas da matriz de métricas simuladas
+GOAL_FIELDS = list(GoalsSchema.model_fields)
+FAVORITES_PER_CLIENT = 5
+
+
+class PlanSnapshot:
+    # clientes e produtos em colunas numpy, com a contribuição atual de cada cliente para o purchase round.
+    # Os ids de produto (nome) são comuns ao catálogo e aos favoritos gravados
+    def __init__(self, clients: list[ClientPurchaseView], products: list[dict]):
+        columns = PurchaseColumns(clients)
+        baseline = NumpyPurchaseEngine().compute_columns(columns)
+        self.number_of_clients = len(clients)
+        self.classifications = columns.classifications
+        self.last_value = np.array([client.last_purchase.total_value if client.last_purchase and client.last_purchase.total_value is not None else np.nan for client in clients], dtype=np.float64)
+        self.last_items = np.array([client.last_purchase.total_items if client.last_purchase and client.last_purchase.total_items is not None else np.nan for client in clients], dtype=np.float64)
+        self.base_items = np.asarray(baseline.total_items, dtype=np.int64)
+        self.base_value = np.asarray(baseline.total_value, dtype=np.float64)
+
+        product_names = [product["name"] for product in products]
+        names, ids = np.unique(np.array(product_names + columns.product_names.tolist(), dtype=object), return_inverse=True)
+        self.number_of_names = len(names)
+        self.product_ids = ids[:len(product_names)]
+        self.product_name_lengths = np.fromiter(map(len, product_names), dtype=np.int64, count=len(product_names))
+        self.product_prices = np.fromiter((product["price"] for product in products), dtype=np.float64, count=len(products))
+        # mesma escolha de favoritos do Service: no modo "bucket" só entre os produtos com o tamanho de nome certo
+        self.favorites = settings.PRODUCT_CATALOG["FAVORITES"]
+        self.products_by_length = np.argsort(self.product_name_lengths, kind="stable")
+        sorted_lengths = self.product_name_lengths[self.products_by_length]
+        self.bucket_starts = np.searchsorted(sorted_lengths, np.arange(sorted_lengths.max(initial=0) + 2), side="left")
+
+        # itens dos favoritos atuais que contam na compra: dono e id do produto
+        owners = np.repeat(np.arange(self.number_of_clients), columns.counts)
+        matched = columns.name_lengths == columns.classifications[owners]
+        self.matched_owners = owners[matched]
+        self.matched_ids = ids[len(product_names):][columns.product_ids[matched]]
+
+
+def affected_clients(snapshot: PlanSnapshot, plan: UpdateCriteria | None) -> np.ndarray:
+    # mesma seleção que Service._build_update_filter faz no Mongo ($lt não casa com last_purchase ausente)
+    if plan is None:
+        return np.zeros(snapshot.number_of_clients, dtype=bool)
+    if plan.total_clients and plan.total_clients == 1001:
+        return np.ones(snapshot.number_of_clients, dtype=bool)
+    mask = np.zeros(snapshot.number_of_clients, dtype=bool)
+    with np.errstate(invalid="ignore"):
+        if plan.average_value_per_client:
+            mask |= snapshot.last_value < plan.average_value_per_client
+        if plan.average_items_per_client:
+            mask |= snapshot.last_items < plan.average_items_per_client
+    return mask
+
+
+def simulate(snapshot: PlanSnapshot, plans: list[tuple[int, UpdateCriteria | None]], seed: int, samples: int) -> np.ndarray:
+    # roda em um processo do ShardPool (ou numa thread): para cada (posição, plano), sorteia novos favoritos para os
+    # clientes afetados como populate_favorites e refaz o purchase round só para eles; devolve a média das amostras
+    # de cada métrica de GoalsSchema, uma linha por plano. A semente vem da posição, então a divisão entre
+    # processos não muda o resultado
+    metrics = np.zeros((len(plans), len(GOAL_FIELDS)), dtype=np.float64)
+    base_counts = np.bincount(snapshot.matched_ids, minlength=snapshot.number_of_names)
+    clients = max(snapshot.number_of_clients, 1)
+    for row, (index, plan) in enumerate(plans):
+        affected = affected_clients(snapshot, plan)
+        kept_items = snapshot.base_items.sum() - snapshot.base_items[affected].sum()
+        kept_value = snapshot.base_value.sum() - snapshot.base_value[affected].sum()
+        kept_counts = base_counts - np.bincount(snapshot.matched_ids[affected[snapshot.matched_owners]], minlength=snapshot.number_of_names)
+        rng = np.random.default_rng([seed, index])
+        classifications = snapshot.classifications[affected]
+        for _ in range(samples):
+            if classifications.size and snapshot.product_prices.size:
+                draws = _draw_favorites(snapshot, classifications, rng)
+                matched = snapshot.product_name_lengths[draws] == classifications[:, None]
+                items = kept_items + matched.sum()
+                value = kept_value + (snapshot.product_prices[draws] * matched).sum()
+                counts = kept_counts + np.bincount(snapshot.product_ids[draws[matched]], minlength=snapshot.number_of_names)
+            else:
+                items, value, counts = kept_items, kept_value, kept_counts
+            metrics[row] += [items, value, snapshot.number_of_clients, value / clients, items / clients, np.count_nonzero(counts)]
+        metrics[row] /= samples
+    return metrics
+
+
+def _draw_favorites(snapshot: PlanSnapshot, classifications: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    # índices de produto sorteados, FAVORITES_PER_CLIENT por cliente
+    shape = (classifications.size, FAVORITES_PER_CLIENT)
+    uniform = rng.integers(0, snapshot.product_prices.size, shape)
+    if snapshot.favorites != "bucket":
+        return uniform
+    # balde [start, end) dos produtos ordenados por tamanho de nome; balde vazio cai no catálogo inteiro
+    lengths = np.clip(classifications, 0, snapshot.bucket_starts.size - 2)
+    starts = snapshot.bucket_starts[lengths]
+    sizes = np.where(classifications < snapshot.bucket_starts.size - 1, snapshot.bucket_starts[lengths + 1] - starts, 0)
+    positions = starts[:, None] + (rng.random(shape) * sizes[:, None]).astype(np.int64)
+    return np.where(sizes[:, None] > 0, snapshot.products_by_length[np.minimum(positions, snapshot.product_prices.size - 1)], uniform)
+
+
+def score(metrics: np.ndarray, goals: GoalsSchema) -> np.ndarray:
+    # soma das faltas relativas em relação aos goals (0 = todos atingidos); goals None não contam
+    targets = np.array([getattr(goals, field) if getattr(goals, field) is not None else np.nan for field in GOAL_FIELDS], dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        shortfall = np.clip(targets - metrics, 0, None) / np.abs(targets)
+    return np.nansum(np.where(np.isfinite(shortfall), shortfall, 0), axis=1)
+
+
+def candidate_plans(goals: GoalsSchema, plan: UpdateCriteria | None) -> list[UpdateCriteria | None]:
+    # o plano original, não fazer nada, refavoritar todos e limiares de média por cliente escalados a partir dos goals
+    candidates = [None, UpdateCriteria(total_clients=1001)]
+    if plan is not None:
+        candidates.append(plan)
+    for factor in settings.PLANNER["CANDIDATE_FACTORS"]:
+        value = goals.average_value_per_client * factor if goals.average_value_per_client else None
+        items = goals.average_items_per_client * factor if goals.average_items_per_client else None
+        candidates += [UpdateCriteria(average_value_per_client=value), UpdateCriteria(average_items_per_client=items), UpdateCriteria(average_value_per_client=value, average_items_per_client=items)]
+    unique = {}
+    for candidate in candidates:
+        # critério sem nenhum campo não seleciona clientes, é o mesmo que não fazer nada
+        key = None if candidate is None or not candidate.model_dump(exclude_none=True) else candidate.model_dump_json()
+        unique.setdefault(key, None if key is None else candidate)
+    return list(unique.values())
+
+
+class PlanSimulator:
+    # avalia planos candidatos sobre um snapshot em memória e devolve o melhor para o Executor
+    def __init__(self, repository, client_filter: dict = None):
+        self.repository = repository
+        self.client_filter = client_filter or {}
+        self.snapshot: PlanSnapshot | None = None
+        self._taken_at = 0.0
+        self.last_report: dict = {}
+
+    async def get_snapshot(self) -> PlanSnapshot:
+        ttl = settings.PLANNER["SNAPSHOT_TTL"]
+        if self.snapshot is None or not ttl or monotonic() - self._taken_at > ttl:
+            clients = []
+            async for batch in self.repository.iter_clients(filter=self.client_filter, projection=PURCHASE_ROUND_PROJECTION, build=ClientPurchaseView.model_validate):
+                clients.extend(batch)
+            products = await ProductCatalog.get_products(self.repository)
+            # montar as colunas é CPU puro: roda numa thread para não travar o event loop
+            self.snapshot = await asyncio.get_running_loop().run_in_executor(None, PlanSnapshot, clients, products)
+            self._taken_at = monotonic()
+        return self.snapshot
+
+    def invalidate(self) -> None:
+        self.snapshot = None
+
+    async def best_plan(self, goals: GoalsSchema, plan: UpdateCriteria | None) -> UpdateCriteria | None:
+        start = perf_counter()
+        snapshot = await self.get_snapshot()
+        candidates = candidate_plans(goals, plan)
+        workers = settings.PLANNER["SIMULATION_WORKERS"]
+        samples = settings.PLANNER["SIMULATION_SAMPLES"]
+        seed = int(np.random.SeedSequence().entropy % 2**32)
+        indexed = list(enumerate(candidates))
+        loop = asyncio.get_running_loop()
+        if workers <= 1:
+            # sem o pool de processos a simulação roda numa thread, fora do event loop
+            metrics = await loop.run_in_executor(None, simulate, snapshot, indexed, seed, samples)
+        else:
+            # cada processo recebe o snapshot e uma fatia dos candidatos
+            chunks = [chunk for chunk in (indexed[worker::workers] for worker in range(workers)) if chunk]
+            pool = ShardPool.get_pool(workers)
+            results = await asyncio.gather(*(loop.run_in_executor(pool, simulate, snapshot, chunk, seed, samples) for chunk in chunks))
+            metrics = np.zeros((len(candidates), len(GOAL_FIELDS)), dtype=np.float64)
+            for chunk, rows in zip(chunks, results):
+                metrics[[index for index, _ in chunk]] = rows
+        scores = score(metrics, goals)
+        writes = np.array([affected_clients(snapshot, candidate).sum() for candidate in candidates])
+        # menor falta em relação aos goals; no empate, o plano que altera menos clientes
+        best = int(np.lexsort((writes, scores))[0])
+        self.last_report = {
+            "candidates": len(candidates),
+            "best": None if candidates[best] is None else candidates[best].model_dump(exclude_none=True),
+            "score": float(scores[best]),
+            "clients_changed": int(writes[best]),
+            "expected": dict(zip(GOAL_FIELDS, metrics[best].tolist())),
+            "elapsed_ms": round((perf_counter() - start) * 1000, 3),
+        }
+        logger.info(f'plan simulation: {self.last_report}')
+        return candidates[best]
+
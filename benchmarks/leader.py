@@ -0,0 +1,88 @@
+# Eleição de líder entre processos locais pelo lease do Mongo (o mesmo usado pelo loop MAPE entre workers).
+#
+#   python -m benchmarks.leader --processes 4 --seconds 30 --ttl 3 --heartbeat 1   (usa MONGO_HOST / MONGO_DATABASE)
+#
+# Cada processo tenta adquirir/renovar o lease a cada heartbeat e registra quando foi dono. No meio da
+# execução o dono é morto (SIGKILL, sem liberar o lease); o relatório mostra se algum instante teve dois
+# donos, os termos de cada dono e quanto tempo o lease ficou sem dono até outro processo assumir.
+import argparse
+import multiprocessing
+import os
+import signal
+import time
+from datetime import datetime, timezone
+
+from app.bootstrap import ApplicationBootstrap
+from app.database.lease import Lease
+
+LEASE_NAME = "benchmark:leader"
+
+
+def contender(index: int, ttl: float, heartbeat: float, deadline: float, events) -> None:
+    # roda em um processo próprio; cada evento é (processo, termo, início da posse, fim da posse)
+    lease = Lease(ApplicationBootstrap().get_mongo_client().leases, LEASE_NAME, holder=f"process-{index}", ttl=ttl)
+    while time.time() < deadline:
+        acquired_at = datetime.now(timezone.utc)
+        if lease.acquire():
+            events.put((index, os.getpid(), lease.term, acquired_at.timestamp(), lease.expires_at.timestamp()))
+        time.sleep(heartbeat)
+    if lease.is_held():
+        lease.release()
+
+
+def overlaps(intervals: list[tuple]) -> int:
+    # pares de posses de processos diferentes que se sobrepõem no tempo
+    count = 0
+    intervals = sorted(intervals, key=lambda interval: interval[3])
+    for position, (index, _, _, _, end) in enumerate(intervals):
+        for other, _, _, start, _ in intervals[position + 1:]:
+            if start >= end:
+                break
+            count += other != index
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--ttl", type=float, default=3)
+    parser.add_argument("--heartbeat", type=float, default=1)
+    args = parser.parse_args()
+
+    ApplicationBootstrap().get_mongo_client().leases.delete_one({"_id": LEASE_NAME})
+    context = multiprocessing.get_context("spawn")
+    events = context.Queue()
+    deadline = time.time() + args.seconds
+    processes = [context.Process(target=contender, args=(index, args.ttl, args.heartbeat, deadline, events)) for index in range(args.processes)]
+    for process in processes:
+        process.start()
+
+    time.sleep(args.seconds / 2)
+    leader = ApplicationBootstrap().get_mongo_client().leases.find_one({"_id": LEASE_NAME})
+    killed_at = time.time()
+    killed = int(leader["holder"].split("-")[1]) if leader and leader.get("holder") else None
+    if killed is not None:
+        os.kill(processes[killed].pid, signal.SIGKILL)
+        print(f"killed process-{killed} (term {leader['term']})")
+
+    for process in processes:
+        process.join()
+    intervals = []
+    while not events.empty():
+        intervals.append(events.get())
+
+    terms = {}
+    for index, _, term, _, _ in intervals:
+        terms.setdefault(term, set()).add(index)
+    takeover = min((start for index, _, _, start, _ in intervals if index != killed and start > killed_at), default=None)
+    print(f"renewals: {len(intervals)}")
+    print(f"terms: {dict(sorted((term, sorted(holders)) for term, holders in terms.items()))}")
+    print(f"terms with more than one holder: {sum(len(holders) > 1 for holders in terms.values())}")
+    print(f"overlapping leaderships: {overlaps(intervals)}")
+    if takeover is not None:
+        print(f"takeover after kill: {takeover - killed_at:.2f}s (ttl {args.ttl}s, heartbeat {args.heartbeat}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# Compara o custo de leitura dos hot paths: documento completo + ClientSchema
+# contra projeção + read model enxuto (ClientPurchaseView).
+#
+#   python -m benchmarks.read_models --clients 100000
+import argparse
+import random
+from time import perf_counter
+import bson
+
+from app.database.schema import FAVORITES_ROUND_PROJECTION, PURCHASE_ROUND_PROJECTION, ClientPurchaseView, ClientSchema
+
+
+def make_documents(number_of_clients: int, seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    products = [
+        {
+            "product_uuid": f"{rng.getrandbits(128):032x}",
+            "name": "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(1, 12))),
+            "price": round(rng.uniform(1, 500), 2),
+            "category": rng.choice(["Books", "Games", "Food", "Toys", "Tools"]),
+            "brand": f"Brand {rng.randint(1, 50)}",
+            "provider": f"Provider {rng.randint(1, 20)}",
+            "description": " ".join(rng.choices(["fast", "cheap", "new", "classic", "premium", "light"], k=8)),
+        }
+        for _ in range(500)
+    ]
+    documents = []
+    for _ in range(number_of_clients):
+        documents.append({
+            "client_uuid": f"{rng.getrandbits(128):032x}",
+            "name": "Jane Doe",
+            "email": "jane.doe@example.com",
+            "gender": rng.choice(["Male", "Female", "Other"]),
+            "civil_status": rng.choice(["Single", "Married", "Divorced", "Widowed"]),
+            "number_of_dependents": rng.randint(0, 5),
+            "education_level": rng.choice(["High School", "Bachelor", "Master", "Doctorate"]),
+            "profession": "Engineer",
+            "income": round(rng.uniform(20000, 120000), 2),
+            "number_of_vehicle": rng.randint(0, 3),
+            "number_of_properties": rng.randint(0, 3),
+            "payment_method": rng.choice(["Credit Card", "Debit Card", "Cash", "Online Payment"]),
+            "favorite_product": "word",
+            "last_purchase": {"total_items": rng.randint(0, 5), "total_value": rng.uniform(0, 1000), "total_clients": None,
+                              "average_value_per_client": None, "average_items_per_client": None, "diferent_products": None},
+            "favorites_list": rng.choices(products, k=5),
+            "hobbies": "reading, hiking, chess",
+            "favorite_music_genre": rng.choice(["Rock", "Pop", "Jazz"]),
+            "favorite_brand": "Acme Inc",
+            "favorite_social_media": rng.choice(["Facebook", "Twitter", "Instagram"]),
+            "gadget_used": rng.choice(["Smartphone", "Tablet", "PC", "Laptop"]),
+            "classification": rng.randint(0, 9),
+        })
+    return documents
+
+
+def project(document: dict, projection: dict) -> dict:
+    # aplica uma projeção de inclusão como o mongod faria (campos com ponto entram em subdocumentos e listas)
+    projected = {}
+    for path, include in projection.items():
+        if not include:
+            continue
+        field, _, rest = path.partition(".")
+        if field not in document:
+            continue
+        value = document[field]
+        if not rest:
+            projected[field] = value
+        elif isinstance(value, list):
+            current = projected.setdefault(field, [{} for _ in value])
+            for target, item in zip(current, value):
+                target.update(project(item, {rest: 1}))
+        elif isinstance(value, dict):
+            projected.setdefault(field, {}).update(project(value, {rest: 1}))
+        else:
+            projected[field] = value
+    return projected
+
+
+def measure(label: str, documents: list[dict], build, repeat: int) -> dict:
+    encoded = sum(len(bson.encode(document)) for document in documents)
+    build(documents[0])
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        for document in documents:
+            build(document)
+        timings.append(perf_counter() - start)
+    elapsed = min(timings)
+    result = {"label": label, "bytes": encoded, "bytes_per_client": encoded / len(documents), "build_ms": elapsed * 1000}
+    print(f'{label:<32} {encoded / 1024 / 1024:>9.2f} MiB {encoded / len(documents):>8.1f} B/client {elapsed * 1000:>10.2f} ms')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    documents = make_documents(args.clients, args.seed)
+    full = measure("full document + ClientSchema", documents, ClientSchema.model_validate, args.repeat)
+    for label, projection in (("purchase_round projection", PURCHASE_ROUND_PROJECTION), ("populate_favorites projection", FAVORITES_ROUND_PROJECTION)):
+        slim = measure(label, [project(document, projection) for document in documents], ClientPurchaseView.model_validate, args.repeat)
+        print(f'{"":<32} {full["bytes"] / slim["bytes"]:>9.1f}x fewer bytes {full["build_ms"] / slim["build_ms"]:>8.1f}x faster build')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# Escalabilidade do purchase_round dividido em shards, de 1 a N processos.
+#
+#   python -m benchmarks.sharding --clients 1000000 --max-shards 8
+#   python -m benchmarks.sharding --mongo --max-shards 4     (usa MONGO_HOST / MONGO_DATABASE)
+#   python -m benchmarks.sharding --snapshot exports/snapshot --max-shards 4   (snapshot mmap de app.database.columnar)
+import argparse
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+import numpy as np
+
+from app.database.schema import ClientPurchaseView, FavoriteView
+from app.service.engine import NumpyPurchaseEngine, PurchaseTotals
+
+BATCH_SIZE = 10000
+
+
+def synthetic_clients(rng: np.random.Generator, size: int) -> list[ClientPurchaseView]:
+    lengths = rng.integers(1, 12, (size, 5))
+    prices = np.round(rng.uniform(1, 500, (size, 5)), 2)
+    classifications = rng.integers(0, 10, size)
+    return [
+        ClientPurchaseView(
+            client_uuid=f"{index:032x}",
+            classification=int(classification),
+            favorites_list=[FavoriteView(name="x" * int(length), price=float(price)) for length, price in zip(row_lengths, row_prices)],
+        )
+        for index, classification, row_lengths, row_prices in zip(range(size), classifications, lengths, prices)
+    ]
+
+
+def offline_shard(seed: int, shard: int, size: int) -> tuple[dict, float]:
+    # só o cálculo (leitura + engine), sem banco: mede o ganho de CPU dos shards
+    rng = np.random.default_rng([seed, shard])
+    engine = NumpyPurchaseEngine()
+    totals = PurchaseTotals()
+    elapsed = 0.0
+    for start in range(0, size, BATCH_SIZE):
+        clients = synthetic_clients(rng, min(BATCH_SIZE, size - start))
+        began = perf_counter()
+        totals.add(engine.compute(clients))
+        elapsed += perf_counter() - began
+    return totals.to_dict(), elapsed
+
+
+def run_offline(clients: int, shards: int, seed: int) -> dict:
+    sizes = [clients // shards + (1 if shard < clients % shards else 0) for shard in range(shards)]
+    start = perf_counter()
+    with ProcessPoolExecutor(max_workers=shards, mp_context=multiprocessing.get_context("spawn")) as pool:
+        partials = list(pool.map(offline_shard, [seed] * shards, range(shards), sizes))
+    wall = perf_counter() - start
+    totals = PurchaseTotals()
+    for partial, _ in partials:
+        totals.merge(PurchaseTotals.from_dict(partial))
+    return {"wall_s": wall, "compute_s": max(elapsed for _, elapsed in partials), "total_clients": totals.total_clients}
+
+
+def snapshot_shard(snapshot: str, start: int, stop: int) -> tuple[dict, float]:
+    # cada processo mapeia o mesmo snapshot e calcula a sua faixa de linhas; as páginas são compartilhadas pelo SO
+    from app.service.service import snapshot_purchase_totals
+    began = perf_counter()
+    totals = snapshot_purchase_totals(snapshot, BATCH_SIZE, start, stop)
+    return totals.to_dict(), perf_counter() - began
+
+
+def run_snapshot(snapshot: str, shards: int) -> dict:
+    from app.database.columnar import ColumnarSnapshot
+    rows = ColumnarSnapshot(snapshot).table("clients").rows
+    bounds = [rows * shard // shards for shard in range(shards + 1)]
+    start = perf_counter()
+    with ProcessPoolExecutor(max_workers=shards, mp_context=multiprocessing.get_context("spawn")) as pool:
+        partials = list(pool.map(snapshot_shard, [snapshot] * shards, bounds[:-1], bounds[1:]))
+    wall = perf_counter() - start
+    totals = PurchaseTotals()
+    for partial, _ in partials:
+        totals.merge(PurchaseTotals.from_dict(partial))
+    return {"wall_s": wall, "compute_s": max(elapsed for _, elapsed in partials), "total_clients": totals.total_clients}
+
+
+def run_mongo(shards: int) -> dict:
+    from app.service.service import Service
+    start = perf_counter()
+    purchase = asyncio.run(Service().purchase_round(shards=shards))
+    return {"wall_s": perf_counter() - start, "compute_s": None, "total_clients": purchase.total_clients}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=200000)
+    parser.add_argument("--max-shards", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongo", action="store_true")
+    parser.add_argument("--snapshot", help="diretório de um snapshot colunar (clients) em vez de dados sintéticos")
+    args = parser.parse_args()
+
+    baseline = None
+    print(f'{"shards":>6} {"wall s":>9} {"compute s":>10} {"speedup":>8} {"efficiency":>10}')
+    for shards in range(1, args.max_shards + 1):
+        if args.snapshot:
+            result = run_snapshot(args.snapshot, shards)
+        else:
+            result = run_mongo(shards) if args.mongo else run_offline(args.clients, shards, args.seed)
+        baseline = baseline or result["wall_s"]
+        speedup = baseline / result["wall_s"]
+        compute = f'{result["compute_s"]:.3f}' if result["compute_s"] is not None else "-"
+        print(f'{shards:>6} {result["wall_s"]:>9.3f} {compute:>10} {speedup:>7.2f}x {speedup / shards:>9.0%}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# Suíte de benchmarks reprodutível para os rounds do Service e as fases do loop MAPE.
+#
+#   python -m benchmarks.suite --sizes 1000,100000 --backend mongomock
+#   python -m benchmarks.suite --sizes 1000,100000,1000000 --mongo-uri mongodb://localhost:27017
+#   python -m benchmarks.suite --baseline benchmarks/baseline.json            (compara e marca regressões)
+#   python -m benchmarks.suite --save-baseline benchmarks/baseline.json
+#
+# O banco de benchmark (--database) é apagado a cada tamanho; nunca aponte para o banco da aplicação.
+import argparse
+import asyncio
+import json
+import random
+import resource
+import sys
+from time import perf_counter
+import numpy as np
+import settings
+
+from app.bootstrap import ApplicationBootstrap
+from app.database.cache import knowledge_cache
+from app.database.indexes import ensure_indexes
+from app.database.schema import UpdateCriteria
+from app.service.catalog import ProductCatalog
+from app.service.generator import populate, seed_baseline
+from app.service.incremental import purchase_state
+
+COLLECTIONS = ["clients", "products", "monitor", "purchase_monitor", "purchase_latest", "purchase_rollups", "symptom", "goals", "round_state"]
+NUMBER_OF_PRODUCTS = 500
+
+
+def summarize(samples: list[float]) -> dict:
+    values = np.asarray(samples, dtype=np.float64)
+    return {
+        "n": int(values.size),
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p99": float(np.percentile(values, 99)),
+        "min": float(values.min()),
+        "max": float(values.max()),
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss vem em KiB no Linux e em bytes no macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+async def timed(samples: list[float], coroutine):
+    start = perf_counter()
+    result = await coroutine
+    samples.append((perf_counter() - start) * 1000)
+    return result
+
+
+class BenchmarkSuite:
+    def __init__(self, seed: int, repeat: int, ticks: int, workers: int):
+        self.seed = seed
+        self.repeat = repeat
+        self.ticks = ticks
+        self.workers = workers
+
+    def reset(self) -> None:
+        database = ApplicationBootstrap().get_mongo_client()
+        for collection in COLLECTIONS:
+            database.drop_collection(collection)
+        ensure_indexes(database)
+        knowledge_cache.invalidate()
+        ProductCatalog.invalidate()
+        purchase_state.invalidate()
+
+    async def run_size(self, number_of_clients: int) -> dict:
+        from MAPE.mape import ControlLoop
+        from app.service.service import Service
+
+        self.reset()
+        random.seed(self.seed)
+        database = ApplicationBootstrap().get_mongo_client()
+        service = Service()
+        result = {"clients": number_of_clients}
+
+        seeded = populate("clients", number_of_clients, self.seed, self.workers, settings.GENERATOR["INSERT_BATCH_SIZE"])
+        populate("products", NUMBER_OF_PRODUCTS, self.seed, 1, settings.GENERATOR["INSERT_BATCH_SIZE"])
+        seed_baseline(database)
+        result["populate_client"] = {"elapsed_ms": seeded["elapsed_s"] * 1000, "rows_per_second": seeded["rows_per_second"]}
+
+        samples = []
+        for _ in range(self.repeat):
+            await timed(samples, service.populate_favorites(plan=UpdateCriteria(total_clients=1001)))
+        result["populate_favorites"] = {**summarize(samples), "clients_per_second": number_of_clients / (np.median(samples) / 1000)}
+
+        samples = []
+        for _ in range(self.repeat):
+            await timed(samples, service.purchase_round())
+        result["purchase_round"] = {**summarize(samples), "clients_per_second": number_of_clients / (np.median(samples) / 1000)}
+
+        control_loop = ControlLoop()
+        await control_loop.monitor.start_event_loop()
+        phases, ticks = {}, []
+        for _ in range(self.ticks):
+            start = perf_counter()
+            for phase, elapsed in (await control_loop.tick()).items():
+                phases.setdefault(phase, []).append(elapsed)
+            ticks.append((perf_counter() - start) * 1000)
+        result["mape_tick"] = summarize(ticks)
+        result["mape_phases"] = {phase: summarize(elapsed) for phase, elapsed in phases.items()}
+        result["peak_rss_mb"] = peak_rss_mb()
+        return result
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta: float) -> list[str]:
+    # compara os p50 (e a vazão de populate_client) de cada tamanho com o baseline salvo;
+    # diferenças absolutas abaixo de min_delta (ms / MiB) são ruído e não contam
+    regressions = []
+    for size, current in results.items():
+        previous = baseline.get(size)
+        if previous is None:
+            continue
+        checks = [(f"{name}.p50", current[name]["p50"], previous[name]["p50"]) for name in ("populate_favorites", "purchase_round", "mape_tick")]
+        checks += [(f"mape_phases.{phase}.p50", stats["p50"], previous["mape_phases"][phase]["p50"]) for phase, stats in current["mape_phases"].items() if phase in previous.get("mape_phases", {})]
+        checks.append(("peak_rss_mb", current["peak_rss_mb"], previous["peak_rss_mb"]))
+        for name, value, reference in checks:
+            if reference and value > reference * (1 + threshold) and value - reference > min_delta:
+                regressions.append(f"{size} clients {name}: {value:.2f} vs baseline {reference:.2f} (+{value / reference - 1:.0%})")
+        rate, reference = current["populate_client"]["rows_per_second"], previous["populate_client"]["rows_per_second"]
+        if reference and rate < reference * (1 - threshold):
+            regressions.append(f"{size} clients populate_client.rows_per_second: {rate:.0f} vs baseline {reference:.0f} ({rate / reference - 1:.0%})")
+    return regressions
+
+
+def print_report(results: dict) -> None:
+    for size, result in results.items():
+        print(f'\n== {size} clients (peak RSS {result["peak_rss_mb"]:.1f} MiB)')
+        print(f'{"populate_client":<28} {result["populate_client"]["elapsed_ms"]:>10.1f} ms {result["populate_client"]["rows_per_second"]:>12.0f} rows/s')
+        for name in ("populate_favorites", "purchase_round"):
+            stats = result[name]
+            print(f'{name:<28} p50 {stats["p50"]:>9.1f} ms  p99 {stats["p99"]:>9.1f} ms {stats["clients_per_second"]:>12.0f} clients/s')
+        print(f'{"mape tick":<28} p50 {result["mape_tick"]["p50"]:>9.1f} ms  p99 {result["mape_tick"]["p99"]:>9.1f} ms')
+        for phase, stats in result["mape_phases"].items():
+            print(f'  {phase:<26} p50 {stats["p50"]:>9.1f} ms  p99 {stats["p99"]:>9.1f} ms')
+
+
+def use_backend(args) -> None:
+    if settings.MONGO["MONGO_DATABASE"] and args.database == settings.MONGO["MONGO_DATABASE"]:
+        raise SystemExit("refusing to benchmark on the application database; pass another --database")
+    settings.MONGO["MONGO_DATABASE"] = args.database
+    if args.backend == "mongomock":
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("the mongomock backend needs `pip install mongomock`")
+        ApplicationBootstrap._client = mongomock.MongoClient()
+    else:
+        settings.MONGO["MONGO_HOST"] = args.mongo_uri
+
+
+async def run(args) -> dict:
+    suite = BenchmarkSuite(seed=args.seed, repeat=args.repeat, ticks=args.ticks, workers=args.workers)
+    results = {}
+    for size in args.sizes:
+        results[str(size)] = await suite.run_size(size)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=lambda value: [int(size) for size in value.split(",")], default=[1000])
+    parser.add_argument("--backend", choices=["mongod", "mongomock"], default="mongod")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="dsoo_benchmark")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--ticks", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", help="grava os resultados em JSON")
+    parser.add_argument("--baseline", help="JSON de um run anterior para comparar")
+    parser.add_argument("--save-baseline", help="grava os resultados como novo baseline")
+    parser.add_argument("--threshold", type=float, default=0.10, help="piora relativa tolerada antes de marcar regressão")
+    parser.add_argument("--min-delta", type=float, default=1.0, help="piora absoluta mínima (ms / MiB) para marcar regressão")
+    args = parser.parse_args()
+
+    use_backend(args)
+    results = asyncio.run(run(args))
+    print_report(results)
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold, args.min_delta)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            raise SystemExit(1)
+        print("\nno regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
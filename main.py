@@ -1,19 +1,54 @@
+from contextlib import asynccontextmanager
 from loguru import logger
 
 from fastapi import FastAPI
 import MAPE.mape as ControlLoop
 import app.handler.handler as Handler
+import settings
+from app.bootstrap import ApplicationBootstrap
+from app.database.events import ChangeStreamSource, event_bus
+from app.database.executor import DatabaseExecutor
+from app.database.indexes import ensure_indexes, explain_hot_queries
+from app import metrics
+from app.service.sharding import ShardPool
 
-from starlette.responses import RedirectResponse
+from starlette.responses import PlainTextResponse, RedirectResponse
 
 
 logger.add("./logs/file_app.log", rotation="1 MB")
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    ApplicationBootstrap.get_shared_client()
+    try:
+        await DatabaseExecutor.run(ensure_indexes, ApplicationBootstrap().get_mongo_client())
+    except Exception:
+        logger.exception("could not ensure indexes")
+    change_stream = None
+    if settings.MAPE["TRIGGER"] == "event" and settings.MAPE["EVENT_SOURCE"] != "bus":
+        change_stream = ChangeStreamSource(ApplicationBootstrap().get_mongo_client(), event_bus)
+        if not change_stream.start():
+            change_stream = None
+    # todos os workers acompanham os leases, para assumir o loop se o dono cair
+    leaderships = [ControlLoop.leadership, *ControlLoop.segment_leaderships.values()]
+    for leadership in leaderships:
+        leadership.watch()
+    yield
+    if change_stream is not None:
+        change_stream.stop()
+    for leadership in leaderships:
+        await leadership.close()
+    ShardPool.shutdown()
+    DatabaseExecutor.shutdown()
+    ApplicationBootstrap.close()
+
+
 app = FastAPI(
     title="FastAPI",
     description="",
     version="0.75.2",
+    lifespan=lifespan,
 )
 
 @app.get("/", tags=["Home"])
@@ -21,6 +56,21 @@ async def redirect():
     response = RedirectResponse(url='/docs')
     return response
 
+
+@app.get("/database/pool", tags=["Database"])
+async def database_pool():
+    return ApplicationBootstrap.pool_stats()
+
+
+@app.get("/database/indexes", tags=["Database"])
+async def database_indexes():
+    return await DatabaseExecutor.run(explain_hot_queries, ApplicationBootstrap().get_mongo_client())
+
+
+@app.get("/metrics", tags=["Metrics"], response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 app.include_router(
     Handler.router,
     prefix="/client",
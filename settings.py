@@ -19,6 +19,14 @@ JWT = {
 MONGO = {
     "MONGO_HOST": os.getenv("MONGO_HOST"),
     "MONGO_DATABASE": os.getenv("MONGO_DATABASE"),
+    "EXECUTOR_WORKERS": int(os.getenv("MONGO_EXECUTOR_WORKERS", 8)),
+    "CURSOR_BATCH_SIZE": int(os.getenv("MONGO_CURSOR_BATCH_SIZE", 1000)),
+    "MAX_POOL_SIZE": int(os.getenv("MONGO_MAX_POOL_SIZE", 20)),
+    "MIN_POOL_SIZE": int(os.getenv("MONGO_MIN_POOL_SIZE", 0)),
+    "MAX_IDLE_TIME_MS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 60000)),
+    "CONNECT_TIMEOUT_MS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 10000)),
+    "SERVER_SELECTION_TIMEOUT_MS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000)),
+    "SOCKET_TIMEOUT_MS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS")) if os.getenv("MONGO_SOCKET_TIMEOUT_MS") else None,
 }
 
 OPEN_AI = {
@@ -26,3 +34,104 @@ OPEN_AI = {
     "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY"),
     "OPENAI_API_CHAT_COMPLETIONS_URL": os.getenv("OPENAI_API_CHAT_COMPLETIONS_URL"),
 }
+
+PURCHASE_ROUND = {
+    "ENGINE": os.getenv("PURCHASE_ROUND_ENGINE", "numpy"),
+    "WRITE_MODE": os.getenv("PURCHASE_ROUND_WRITE_MODE", "bulk"),
+    "BULK_BATCH_SIZE": int(os.getenv("PURCHASE_ROUND_BULK_BATCH_SIZE", 1000)),
+    "BULK_ORDERED": os.getenv("PURCHASE_ROUND_BULK_ORDERED", "false").lower() == "true",
+    # "full" recalcula todos os clientes; "incremental" só os alterados desde o último round
+    "MODE": os.getenv("PURCHASE_ROUND_MODE", "full"),
+    # a cada N rounds incrementais um round completo confere e reconstrói o estado (0 desliga)
+    "VERIFY_EVERY": int(os.getenv("PURCHASE_ROUND_VERIFY_EVERY", 50)),
+}
+
+MAPE = {
+    "TICK_INTERVAL": float(os.getenv("MAPE_TICK_INTERVAL", 2)),
+    # loops segmentados de /mape/segments: "classification" ou JSON {"nome": filtro}; vazio (padrão) desliga.
+    # Cada segmento configurado tem um lease acompanhado por todos os workers a cada HEARTBEAT_INTERVAL
+    "SEGMENTS": os.getenv("MAPE_SEGMENTS", ""),
+    # "poll": tick a cada TICK_INTERVAL; "event": tick quando chega um evento (nova compra, break condition),
+    # com polling de reserva que dobra o intervalo a cada tick ocioso até MAX_IDLE_INTERVAL
+    "TRIGGER": os.getenv("MAPE_TRIGGER", "poll"),
+    # "auto" tenta change streams e cai para o barramento em memória; "bus" usa só o barramento
+    "EVENT_SOURCE": os.getenv("MAPE_EVENT_SOURCE", "auto"),
+    "MAX_IDLE_INTERVAL": float(os.getenv("MAPE_MAX_IDLE_INTERVAL", 30)),
+    "BACKOFF_FACTOR": float(os.getenv("MAPE_BACKOFF_FACTOR", 2)),
+    # um só loop entre todos os workers/processos: quem tem o lease (coleção leases) roda, os demais esperam
+    "LEADER_ELECTION": os.getenv("MAPE_LEADER_ELECTION", "true").lower() == "true",
+    # segundos de validade do lease e intervalo de renovação/verificação (menor que o ttl)
+    "LEASE_TTL": float(os.getenv("MAPE_LEASE_TTL", 15)),
+    "HEARTBEAT_INTERVAL": float(os.getenv("MAPE_HEARTBEAT_INTERVAL", 5)),
+    # máximo de loops (global + segmentos) liderados por processo, para dividir os segmentos entre os workers; 0 sem limite
+    "MAX_LEADERSHIPS": int(os.getenv("MAPE_MAX_LEADERSHIPS", 0)),
+}
+
+PLANNER = {
+    # "goals" executa os campos do sintoma como critério; "simulate" avalia planos candidatos em um snapshot
+    # dos clientes e executa só o que mais se aproxima dos goals
+    "MODE": os.getenv("PLANNER_MODE", "goals"),
+    # processos do ShardPool que dividem os candidatos; 1 simula no próprio processo, numa thread fora do event loop
+    "SIMULATION_WORKERS": int(os.getenv("PLANNER_SIMULATION_WORKERS", 1)),
+    # sorteios de favoritos por candidato (a métrica é a média)
+    "SIMULATION_SAMPLES": int(os.getenv("PLANNER_SIMULATION_SAMPLES", 4)),
+    # multiplicadores dos goals de média por cliente usados como limiares dos candidatos
+    "CANDIDATE_FACTORS": [float(factor) for factor in os.getenv("PLANNER_CANDIDATE_FACTORS", "0.5,0.75,1,1.25,1.5,2").split(",") if factor],
+    # segundos de reaproveitamento do snapshot; 0 relê os clientes a cada plano
+    "SNAPSHOT_TTL": float(os.getenv("PLANNER_SNAPSHOT_TTL", 0)),
+}
+
+PRODUCT_CATALOG = {
+    # segundos até recarregar os produtos do banco; 0 mantém a lista até invalidate()
+    "TTL": float(os.getenv("PRODUCT_CATALOG_TTL", 300)),
+    # "bucket" sorteia os favoritos entre os produtos cujo nome tem o tamanho da classification do cliente;
+    # "uniform" sorteia do catálogo inteiro
+    "FAVORITES": os.getenv("PRODUCT_CATALOG_FAVORITES", "bucket"),
+    # limites das faixas de preço do índice de produtos
+    "PRICE_BANDS": [float(bound) for bound in os.getenv("PRODUCT_CATALOG_PRICE_BANDS", "50,100,250").split(",") if bound],
+}
+
+KNOWLEDGE_CACHE = {
+    # segundos de validade do estado do loop em memória; 0 mantém até a próxima escrita
+    "TTL": float(os.getenv("KNOWLEDGE_CACHE_TTL", 60)),
+}
+
+CLIENT_CACHE = {
+    # respostas de GET /client/{client_uuid} em memória: número máximo de clientes e segundos de validade.
+    # Cada worker tem o seu cache; TTL limita por quanto tempo um worker serve um cliente alterado por outro
+    "SIZE": int(os.getenv("CLIENT_CACHE_SIZE", 10000)),
+    "TTL": float(os.getenv("CLIENT_CACHE_TTL", 30)),
+    # máximo de client_uuids por chamada de POST /client/client/batch
+    "BATCH_LIMIT": int(os.getenv("CLIENT_CACHE_BATCH_LIMIT", 1000)),
+}
+
+GENERATOR = {
+    "WORKERS": int(os.getenv("GENERATOR_WORKERS", 1)),
+    "INSERT_BATCH_SIZE": int(os.getenv("GENERATOR_INSERT_BATCH_SIZE", 5000)),
+}
+
+METRICS = {
+    # histogramas e contadores em memória expostos em GET /metrics
+    "ENABLED": os.getenv("METRICS_ENABLED", "true").lower() == "true",
+}
+
+PURCHASE_HISTORY = {
+    # purchase_monitor como coleção time-series (só vale ao criar a coleção)
+    "TIMESERIES": os.getenv("PURCHASE_HISTORY_TIMESERIES", "true").lower() == "true",
+    # dias de retenção dos registros brutos; 0 (padrão) mantém para sempre. Com valor definido, uma
+    # purchase_monitor comum já existente recebe um índice TTL e passa a apagar os registros antigos
+    "RETENTION_DAYS": int(os.getenv("PURCHASE_HISTORY_RETENTION_DAYS", 0)),
+    "MINUTE_ROLLUP_DAYS": int(os.getenv("PURCHASE_HISTORY_MINUTE_ROLLUP_DAYS", 7)),
+    "HOUR_ROLLUP_DAYS": int(os.getenv("PURCHASE_HISTORY_HOUR_ROLLUP_DAYS", 365)),
+}
+
+EXPORT = {
+    # snapshot colunar (app.database.columnar): linhas por row group e diretório base do endpoint de exportação
+    "ROW_GROUP_SIZE": int(os.getenv("EXPORT_ROW_GROUP_SIZE", 50000)),
+    "DIRECTORY": os.getenv("EXPORT_DIRECTORY", "./exports"),
+}
+
+SHARDING = {
+    # número de processos que dividem purchase_round / populate_favorites por faixa de client_uuid; 1 desliga
+    "SHARDS": int(os.getenv("SHARDS", 1)),
+}
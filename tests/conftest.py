@@ -0,0 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import settings
+from app.bootstrap import ApplicationBootstrap
+from app.database.cache import client_cache, knowledge_cache
+from app.database.executor import DatabaseExecutor
+from app.service.catalog import ProductCatalog
+from app.service.incremental import IncrementalPurchaseState
+import app.service.incremental as incremental
+import app.service.service as service
+
+
+@pytest.fixture
+def database(monkeypatch):
+    # banco em memória (mongomock) com o estado de processo zerado; os testes que usam o fixture
+    # são pulados se o mongomock não estiver instalado
+    mongomock = pytest.importorskip("mongomock")
+    monkeypatch.setitem(settings.MONGO, "MONGO_DATABASE", "test")
+    monkeypatch.setattr(ApplicationBootstrap, "_client", mongomock.MongoClient())
+    # o mongomock não é thread-safe: uma thread só para as chamadas do DatabaseExecutor
+    monkeypatch.setattr(DatabaseExecutor, "_pool", ThreadPoolExecutor(max_workers=1))
+    state = IncrementalPurchaseState()
+    monkeypatch.setattr(incremental, "purchase_state", state)
+    monkeypatch.setattr(service, "purchase_state", state)
+    knowledge_cache.invalidate()
+    client_cache.invalidate()
+    ProductCatalog.invalidate()
+    yield ApplicationBootstrap().get_mongo_client()
+    DatabaseExecutor._pool.shutdown(wait=True)
+    knowledge_cache.invalidate()
+    client_cache.invalidate()
+    ProductCatalog.invalidate()
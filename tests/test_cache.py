@@ -0,0 +1,40 @@
+from app.database.cache import ClientCache
+
+
+def test_read_started_before_invalidation_is_not_cached():
+    cache = ClientCache(size=10)
+    # leitura começa (guarda a geração), uma escrita invalida a chave e só então a leitura tenta preencher o cache
+    generation = cache.generation
+    cache.invalidate(["a"])
+    cache.set("a", b"old", '"old"', generation)
+    assert cache.get("a") is None
+    # uma leitura iniciada depois da escrita preenche normalmente
+    cache.set("a", b"new", '"new"', cache.generation)
+    assert cache.get("a") == (b"new", '"new"')
+
+
+def test_invalidation_marks_only_the_written_keys():
+    cache = ClientCache(size=10)
+    generation = cache.generation
+    cache.invalidate(["a"])
+    cache.set("b", b"b", '"b"', generation)
+    assert cache.get("b") == (b"b", '"b"')
+
+
+def test_full_invalidation_rejects_every_earlier_read():
+    cache = ClientCache(size=10)
+    generation = cache.generation
+    cache.set("a", b"a", '"a"', generation)
+    cache.invalidate()
+    assert cache.get("a") is None
+    cache.set("b", b"b", '"b"', generation)
+    assert cache.get("b") is None
+
+
+def test_too_many_marks_fall_back_to_a_floor():
+    cache = ClientCache(size=2)
+    generation = cache.generation
+    cache.invalidate(["a", "b", "c"])
+    # as marcas foram descartadas, mas a leitura antiga continua recusada pelo piso de geração
+    cache.set("z", b"z", '"z"', generation)
+    assert cache.get("z") is None
@@ -0,0 +1,71 @@
+import random
+
+from app.service.catalog import ProductIndex
+
+
+def product(product_uuid: str, name: str, price: float = 10.0, category: str = "Books", brand: str = "acme") -> dict:
+    return {"product_uuid": product_uuid, "name": name, "price": price, "category": category, "brand": brand}
+
+
+def assert_consistent(index: ProductIndex) -> None:
+    # cada produto aparece uma vez em cada um dos seus baldes, na posição registrada
+    for key, bucket in index._buckets.items():
+        assert bucket, key
+        for position, item in enumerate(bucket):
+            assert index._positions[key, item["product_uuid"]] == position
+    expected = {}
+    for item in index._products.values():
+        for key in index._keys(item):
+            expected.setdefault(key, set()).add(item["product_uuid"])
+    assert {key: {item["product_uuid"] for item in bucket} for key, bucket in index._buckets.items()} == expected
+    assert len(index._positions) == sum(len(bucket) for bucket in index._buckets.values())
+
+
+def test_remove_from_the_middle_moves_the_last_product():
+    index = ProductIndex(price_bands=[50])
+    for number in range(4):
+        index.add(product(f"p{number}", "abc"))
+    index.remove("p1")
+    assert [item["product_uuid"] for item in index.bucket(3)] == ["p0", "p3", "p2"]
+    assert_consistent(index)
+
+
+def test_removing_the_last_product_drops_the_bucket():
+    index = ProductIndex(price_bands=[50])
+    index.add(product("p0", "abcd", category="Toys"))
+    index.add(product("p1", "abc"))
+    index.remove("p0")
+    assert index.bucket(4) == [] and index.bucket(4, category="Toys") == []
+    assert index.stats()["by_name_length"] == {3: 1}
+    assert_consistent(index)
+
+
+def test_re_adding_a_product_moves_it_between_buckets():
+    index = ProductIndex(price_bands=[50])
+    index.add(product("p0", "abc", price=10))
+    index.add(product("p0", "abcde", price=90))
+    assert index.bucket(3) == [] and [item["product_uuid"] for item in index.bucket(5, price_band=1)] == ["p0"]
+    assert len(index) == 1
+    assert_consistent(index)
+
+
+def test_random_adds_and_removes_keep_buckets_consistent():
+    rng = random.Random(3)
+    index = ProductIndex(price_bands=[25, 50, 75])
+    for step in range(2000):
+        product_uuid = f"p{rng.randrange(60)}"
+        if rng.random() < 0.4:
+            index.remove(product_uuid)
+        else:
+            index.add(product(product_uuid, "x" * rng.randint(1, 6), rng.uniform(0, 100), rng.choice(["Books", "Toys"]), rng.choice(["a", "b", "c"])))
+    assert_consistent(index)
+
+
+def test_refresh_applies_only_the_difference():
+    index = ProductIndex(price_bands=[50])
+    products = [product(f"p{number}", "abc") for number in range(3)]
+    index.refresh(products)
+    changed = [products[0], product("p1", "abcd"), product("p3", "ab")]
+    assert index.refresh(changed) == {"added_or_changed": 2, "removed": 1}
+    assert sorted(index._products) == ["p0", "p1", "p3"]
+    assert_consistent(index)
@@ -0,0 +1,64 @@
+import random
+
+from app.database.schema import ClientPurchaseView
+from app.service.engine import NumpyPurchaseEngine, PurchaseResult, PurchaseTotals, PythonPurchaseEngine
+
+# nomes com acentos, emoji e caracteres combinantes: len() conta code points nos dois engines
+NAMES = ["", "a", "ação", "café", "naïve", "日本語", "🛒🛒", "éclair", "Zoë ☕", "straße", "produto", "ñandú"]
+
+
+def random_clients(rng: random.Random, number_of_clients: int) -> list[ClientPurchaseView]:
+    clients = []
+    for index in range(number_of_clients):
+        favorites = [{"name": rng.choice(NAMES), "price": rng.uniform(0, 1000)} for _ in range(rng.randint(0, 7))]
+        clients.append(ClientPurchaseView.model_validate({
+            "client_uuid": f"client-{index}",
+            "classification": rng.randint(0, 9),
+            # sem favoritos: lista vazia e campo ausente
+            "favorites_list": favorites if favorites or index % 2 else None,
+        }))
+    return clients
+
+
+def totals(engine, clients: list[ClientPurchaseView], batch_size: int) -> PurchaseTotals:
+    result = PurchaseTotals()
+    for start in range(0, len(clients), batch_size):
+        result.add(engine.compute(clients[start:start + batch_size]))
+    return result
+
+
+def test_numpy_engine_matches_python_engine():
+    clients = random_clients(random.Random(2024), 2000)
+    for batch_size in (1, 7, 500, 2000):
+        python, numpy = totals(PythonPurchaseEngine(), clients, batch_size), totals(NumpyPurchaseEngine(), clients, batch_size)
+        assert (python.final_items, python.total_clients, python.products) == (numpy.final_items, numpy.total_clients, numpy.products)
+        # mesmo float bit a bit, não só dentro de uma tolerância
+        assert float(python.final_value).hex() == float(numpy.final_value).hex()
+        assert python.to_schema().model_dump(exclude={"created_at", "updated_at"}) == numpy.to_schema().model_dump(exclude={"created_at", "updated_at"})
+
+
+def test_engines_agree_per_client():
+    clients = random_clients(random.Random(7), 300)
+    python, numpy = PythonPurchaseEngine().compute(clients), NumpyPurchaseEngine().compute(clients)
+    assert python.client_uuids == numpy.client_uuids
+    assert python.total_items == numpy.total_items
+    assert [float(value).hex() for value in python.total_value] == [float(value).hex() for value in numpy.total_value]
+    assert python.products == numpy.products
+
+
+
+
+def test_empty_totals_have_zero_averages():
+    purchase = PurchaseTotals().to_schema()
+    assert purchase.total_clients == 0
+    assert purchase.average_value_per_client == 0
+    assert purchase.average_items_per_client == 0
+
+
+def test_totals_averages():
+    totals = PurchaseTotals()
+    totals.add(PurchaseResult(["a", "b"], [1, 3], [10.0, 30.0], {"x", "y"}))
+    purchase = totals.to_schema()
+    assert purchase.average_value_per_client == 20.0
+    assert purchase.average_items_per_client == 2.0
+    assert purchase.diferent_products == 2
@@ -0,0 +1,23 @@
+import asyncio
+
+from app.database.events import event_bus
+from app.database.repository import Repository
+from app.service.generator import seed_baseline
+
+
+def test_cancel_break_condition_echo_is_recognised(database):
+    seed_baseline(database)
+    monitor_id = database.monitor.find_one({"segment": None})["_id"]
+
+    async def scenario():
+        subscription = event_bus.subscribe()
+        try:
+            await Repository(database).cancel_break_condition()
+            return await asyncio.wait_for(subscription.wait(), timeout=5)
+        finally:
+            subscription.close()
+    events = asyncio.run(scenario())
+    assert [(event.kind, event.document_id) for event in events] == [("break_condition", monitor_id)]
+    # o change stream descarta o eco desta escrita, mas não uma escrita posterior de outro processo no mesmo documento
+    assert event_bus.is_local(monitor_id)
+    assert not event_bus.is_local(monitor_id)
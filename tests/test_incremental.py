@@ -0,0 +1,89 @@
+import asyncio
+import random
+from math import isclose
+import pytest
+from app.database.repository import Repository
+from app.database.schema import UpdateCriteria
+from app.service.engine import NumpyPurchaseEngine
+from app.service.generator import populate, seed_baseline
+from app.service.incremental import IncrementalPurchaseState
+from app.service.service import Service
+import app.service.service as service_module
+
+
+@pytest.fixture
+def populated(database):
+    random.seed(7)
+    populate("clients", 300, 1, 1, 1000)
+    populate("products", 80, 2, 1, 1000)
+    seed_baseline(database)
+    asyncio.run(Service().populate_favorites(UpdateCriteria(total_clients=1001)))
+    return database
+
+
+def assert_same_totals(incremental, full):
+    assert incremental.total_items == full.total_items
+    assert incremental.total_clients == full.total_clients
+    assert incremental.diferent_products == full.diferent_products
+    assert isclose(incremental.total_value, full.total_value, rel_tol=1e-9, abs_tol=1e-6)
+
+
+def test_incremental_matches_full_after_favorites_update(populated):
+    async def scenario():
+        service = Service()
+        await service.purchase_round(mode="incremental")
+        await service.populate_favorites(UpdateCriteria(average_items_per_client=2))
+        incremental = await service.purchase_round(mode="incremental")
+        full = await service.purchase_round(mode="full")
+        return incremental, full
+
+    assert_same_totals(*asyncio.run(scenario()))
+
+
+def test_incremental_sees_favorites_written_by_another_process(populated):
+    async def scenario():
+        service = Service()
+        await service.purchase_round(mode="incremental")
+        # outro processo: grava favoritos direto no banco e avança a versão, sem as marcas deste processo
+        products = [product.model_dump() for product in await Repository().get_all_products()]
+        for client in populated.clients.find({}, {"client_uuid": 1}).limit(100):
+            populated.clients.update_one({"client_uuid": client["client_uuid"]}, {"$set": {"favorites_list": random.choices(products, k=5)}})
+        await Repository().bump_favorites_version()
+        incremental = await service.purchase_round(mode="incremental")
+        full = await service.purchase_round(mode="full")
+        return incremental, full
+
+    assert_same_totals(*asyncio.run(scenario()))
+
+
+def test_incremental_sees_clients_inserted_by_another_process(populated, monkeypatch):
+    async def scenario():
+        service = Service()
+        await service.purchase_round(mode="incremental")
+        # outro worker, com o seu próprio estado incremental, insere clientes pela rota de populate
+        with monkeypatch.context() as other_process:
+            other_process.setattr(service_module, "purchase_state", IncrementalPurchaseState())
+            await Service().populate_client(50, seed=11)
+        incremental = await service.purchase_round(mode="incremental")
+        full = await service.purchase_round(mode="full")
+        return incremental, full
+
+    incremental, full = asyncio.run(scenario())
+    assert incremental.total_clients == 350
+    assert_same_totals(incremental, full)
+
+
+def test_unchanged_clients_are_not_written(populated):
+    async def scenario():
+        service = Service()
+        engine = NumpyPurchaseEngine()
+        _, first = await service._full_purchase_round(engine, "single")
+        before = {client["client_uuid"]: client for client in populated.clients.find({}, {"_id": 0})}
+        updates = []
+        service.repository.update_client = lambda **fields: updates.append(fields)
+        await service._full_purchase_round(engine, "single")
+        return before, updates
+    before, updates = asyncio.run(scenario())
+    # a segunda rodada recalcula as mesmas compras: nenhum cliente é gravado
+    assert updates == []
+    assert {client["client_uuid"]: client for client in populated.clients.find({}, {"_id": 0})} == before
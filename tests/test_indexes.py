@@ -0,0 +1,9 @@
+from app.database.indexes import _plan_stages, _winning_plan
+
+
+def test_winning_plan_from_find_and_time_series_explain():
+    plan = {"stage": "LIMIT", "inputStage": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}}
+    assert _plan_stages(_winning_plan({"queryPlanner": {"winningPlan": plan}})) == ["LIMIT", "FETCH", "IXSCAN"]
+    # find em coleção time-series: explain no formato de agregação, plano dos buckets no $cursor
+    time_series = {"stages": [{"$cursor": {"queryPlanner": {"winningPlan": {"queryPlan": {"stage": "COLLSCAN"}}}}}, {"$_internalUnpackBucket": {}}]}
+    assert _plan_stages(_winning_plan(time_series)) == ["COLLSCAN"]
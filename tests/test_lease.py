@@ -0,0 +1,67 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import pytest
+
+from app.database.lease import Lease, LeaseLost, current_lease
+from app.database.unit_of_work import UnitOfWork
+
+
+def write_symptoms(database, lease: Lease, symptoms: list[str]) -> None:
+    async def tick():
+        current_lease.set(lease)
+        async with UnitOfWork() as unit_of_work:
+            unit_of_work.set_fields(database.symptom, {"symptoms": symptoms}, {"segment": None})
+    asyncio.run(tick())
+
+
+def test_stale_leader_writes_are_rejected(database):
+    database.symptom.insert_one({"segment": None, "symptoms": []})
+    first = Lease(database.leases, "loop", holder="first", ttl=30)
+    second = Lease(database.leases, "loop", holder="second", ttl=30)
+    assert first.acquire() and first.term == 1
+    write_symptoms(database, first, ["a"])
+    assert database.symptom.find_one()["lease_term"] == 1
+
+    # o lease do primeiro vence e o segundo assume; o primeiro ainda acha que é o dono
+    database.leases.update_one({"_id": "loop"}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}})
+    assert second.acquire() and second.term == 2
+    with pytest.raises(LeaseLost):
+        write_symptoms(database, first, ["stale"])
+    write_symptoms(database, second, ["b"])
+    document = database.symptom.find_one()
+    assert document["symptoms"] == ["b"] and document["lease_term"] == 2
+
+
+def test_older_term_cannot_overwrite_newer_state(database):
+    database.symptom.insert_one({"segment": None, "symptoms": ["new"], "lease_term": 5})
+    lease = Lease(database.leases, "loop", holder="first", ttl=30)
+    assert lease.acquire() and lease.term == 1
+    write_symptoms(database, lease, ["old"])
+    assert database.symptom.find_one()["symptoms"] == ["new"]
+
+
+def test_is_held_with_margin(database):
+    lease = Lease(database.leases, "loop", holder="first", ttl=3)
+    assert lease.acquire()
+    assert lease.is_held(margin=1)
+    assert not lease.is_held(margin=5)
+
+
+def test_scheduler_stops_on_lost_lease():
+    from MAPE.mape import LoopScheduler
+
+    class DeposedLoop:
+        ticks = 0
+
+        async def tick(self):
+            DeposedLoop.ticks += 1
+            raise LeaseLost("lease 'loop' is no longer held (term 1)")
+
+    async def scenario():
+        scheduler = LoopScheduler(interval=0.01)
+        scheduler.trigger = "interval"
+        await asyncio.wait_for(scheduler._run(DeposedLoop()), timeout=5)
+        return scheduler
+    scheduler = asyncio.run(scenario())
+    assert DeposedLoop.ticks == 1
+    assert scheduler.lease_lost and scheduler.stop_event.is_set()
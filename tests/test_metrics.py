@@ -0,0 +1,28 @@
+import asyncio
+
+from app.database.repository import Repository
+from app.metrics import DATABASE_DOCUMENTS, DATABASE_OPERATION_SECONDS
+from app.service.generator import seed_baseline
+
+
+def observed(operation: str) -> tuple[int, float]:
+    series = DATABASE_OPERATION_SECONDS._series.get(("Repository", operation))
+    return (series[2] if series else 0), DATABASE_DOCUMENTS._values.get(("Repository", operation), 0)
+
+
+def test_knowledge_cache_hits_are_not_database_operations(database):
+    seed_baseline(database)
+    repository = Repository(database)
+    before = {operation: observed(operation) for operation in ("get_goals", "get_symptom", "get_break_condition", "get_last_purchase")}
+
+    async def read_twice():
+        for _ in range(2):
+            await repository.get_goals()
+            await repository.get_symptom()
+            await repository.get_break_condition()
+            await repository.get_last_purchase()
+    asyncio.run(read_twice())
+
+    # só a primeira leitura (miss) vai ao banco e entra nas métricas
+    for operation, (count, documents) in before.items():
+        assert observed(operation) == (count + 1, documents + 1)
@@ -0,0 +1,35 @@
+import asyncio
+import pytest
+import settings
+from app.service.generator import populate
+from app.service.service import Service
+
+
+@pytest.fixture
+def exports(database, tmp_path, monkeypatch):
+    monkeypatch.setitem(settings.EXPORT, "DIRECTORY", str(tmp_path / "exports"))
+    return tmp_path / "exports"
+
+
+def test_offline_round_on_empty_snapshot(exports):
+    service = Service()
+    report = asyncio.run(service.export_snapshot(["clients"]))
+    assert report["collections"]["clients"]["rows"] == 0
+    purchase = asyncio.run(service.offline_purchase_round(report["snapshot"]))
+    assert purchase.total_clients == 0
+    assert purchase.average_value_per_client == 0
+
+
+def test_exports_in_the_same_second_do_not_clash(exports):
+    populate("clients", 20, 5, 1, 10)
+    service = Service()
+    first = asyncio.run(service.export_snapshot(["clients"]))
+    second = asyncio.run(service.export_snapshot(["clients"]))
+    assert first["snapshot"] != second["snapshot"]
+    assert asyncio.run(service.offline_purchase_round(second["snapshot"])).total_clients == 20
+
+
+@pytest.mark.parametrize("snapshot", ["..", "../elsewhere", "/etc", ""])
+def test_offline_round_rejects_paths_outside_the_export_directory(exports, snapshot):
+    with pytest.raises(ValueError):
+        asyncio.run(Service().offline_purchase_round(snapshot))
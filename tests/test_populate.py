@@ -0,0 +1,13 @@
+import pytest
+
+from app.service.generator import DuplicateSeedError, populate
+
+
+def test_repeated_seed_is_reported_as_duplicate(database):
+    database.clients.create_index("client_uuid", unique=True)
+    report = populate("clients", 50, 7, 1, 20)
+    assert report["inserted"] == 50
+    with pytest.raises(DuplicateSeedError, match="seed 7"):
+        populate("clients", 50, 7, 1, 20)
+    assert populate("clients", 50, 8, 1, 20)["inserted"] == 50
+    assert database.clients.count_documents({}) == 100
@@ -0,0 +1,21 @@
+from app.service.sharding import ShardPool
+
+
+class SlowPool:
+    def __init__(self):
+        self.calls = []
+
+    def shutdown(self, wait=True):
+        self.calls.append(wait)
+
+
+def test_growing_the_pool_does_not_wait_for_the_old_one(monkeypatch):
+    old = SlowPool()
+    monkeypatch.setattr(ShardPool, "_pool", old)
+    monkeypatch.setattr(ShardPool, "_workers", 1)
+    pool = ShardPool.get_pool(2)
+    try:
+        assert old.calls == [False]
+        assert ShardPool._workers == 2 and ShardPool.get_pool(1) is pool
+    finally:
+        ShardPool.shutdown()
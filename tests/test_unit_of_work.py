@@ -0,0 +1,57 @@
+import asyncio
+
+from app.database.repository import Repository
+from app.database.schema import GoalsSchema, SymptomSchema
+from app.database.unit_of_work import UnitOfWork
+from app.service.generator import seed_baseline
+
+
+class RecordingCollection:
+    # repassa para a coleção real e guarda os update_one feitos
+    def __init__(self, collection):
+        self.collection = collection
+        self.updates = []
+
+    def update_one(self, filter, update, **kwargs):
+        self.updates.append((filter, update))
+        return self.collection.update_one(filter, update, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+def test_symptom_reset_then_set_is_one_write(database):
+    seed_baseline(database)
+    repository = Repository(database)
+    repository.symptom = RecordingCollection(database.symptom)
+
+    async def tick():
+        async with UnitOfWork() as unit_of_work:
+            await repository.update_symptom(SymptomSchema(update_symptom=False, symptoms=[]))
+            await repository.update_symptom(SymptomSchema(update_symptom=True, symptoms=["total_value"]))
+            # dentro da unidade a leitura já vê o valor novo, sem ir ao banco
+            assert (await repository.get_symptom()).symptoms == ["total_value"]
+            assert repository.symptom.updates == []
+        return unit_of_work
+    unit_of_work = asyncio.run(tick())
+
+    assert unit_of_work.writes == 2 and unit_of_work.operations == 1
+    assert repository.symptom.updates == [({"segment": None}, {"$set": {"update_symptom": True, "symptoms": ["total_value"]}})]
+    document = database.symptom.find_one({"segment": None})
+    assert document["update_symptom"] is True and document["symptoms"] == ["total_value"]
+
+
+def test_one_operation_per_collection(database):
+    seed_baseline(database)
+    repository = Repository(database)
+
+    async def tick():
+        async with UnitOfWork() as unit_of_work:
+            await repository.update_symptom(SymptomSchema(update_symptom=True, symptoms=["a"]))
+            await repository.update_goals(GoalsSchema(total_items=1))
+            await repository.update_goals(GoalsSchema(total_items=2))
+        return unit_of_work
+    unit_of_work = asyncio.run(tick())
+
+    assert unit_of_work.operations == 2 and unit_of_work.flushes == 1
+    assert database.goals.find_one({"segment": None})["total_items"] == 2